@@ -0,0 +1,116 @@
+from typing import Iterable, Optional, Tuple, Union, BinaryIO
+
+import numpy as np
+
+from grid.domain import UNCOLLAPSED
+from grid.grid import Grid
+from grid.pos import Pos
+from tiles import bitset
+from tiles.image import to_uint8
+
+
+# image of a 2d grid that is kept up to date by re-rendering only the cells written since the last update, which
+# the grid collects in its dirty set; a collapse and its propagation usually touch a handful of cells, so a frame
+# costs that many tile rectangles rather than the whole image
+# frame is updated in place; cells is a (rows, h, cols, w) view of it with the tile rectangles along axes 0 and 2
+class FrameRenderer:
+
+    def __init__(self, grid: Grid):
+        if grid.compiled.atlas is None or grid.dim != 2:
+            raise ValueError("Only 2d grids of a tileset with a pixel atlas can be rendered")
+        self.grid = grid
+        self.origin = np.array([lo for lo, hi in grid.index_bounds])
+        (rows, cols), (h, w) = grid.shape, grid.compiled.atlas.shape[1:3]
+        self.frame = np.zeros((rows * h, cols * w) + grid.compiled.atlas.shape[3:], dtype=np.float32)
+        self.cells = self.frame.reshape((rows, h, cols, w) + self.frame.shape[2:])
+        grid.take_dirty()
+        self.patch(grid.pos_iterator)
+
+    # re-renders the cells changed since the last update and returns how many there were
+    def update(self) -> int:
+        dirty = self.grid.take_dirty()
+        self.patch(dirty)
+        return len(dirty)
+
+    def patch(self, positions: Iterable[Pos]):
+        positions = list(positions)
+        if len(positions) == 0:
+            return
+        words = np.array([self.grid.get_domain(pos) for pos in positions])
+        known = bitset.to_bool(words, self.grid.n_tiles)
+        tile_ids = np.where(known.sum(axis=1) == 1, known.argmax(axis=1), UNCOLLAPSED)
+        index = np.array(positions) - self.origin
+        self.cells[index[:, 0], :, index[:, 1], :] = self.grid.compiled.render_cells(tile_ids, words)
+
+
+# headless stream of equally shaped frames, either raw bytes, e.g. for ffmpeg -f rawvideo -pix_fmt gray, or a .npy
+# file of shape (n_frames, *frame_shape); the .npy header is written with room to spare and rewritten with the final
+# frame count on close, so the file needs to be seekable but the frames never have to be held in memory
+# frames are in [0, 1] and stored as uint8 in [0, 255] by default, or in any float dtype as they are
+class FrameWriter:
+    HEADER_SIZE = 128
+
+    def __init__(self, file: Union[str, BinaryIO], frame_shape: Tuple[int, ...], dtype=np.uint8,
+                 format: str = 'npy'):
+        if format not in ('npy', 'raw'):
+            raise ValueError(f"Unknown frame format {format}")
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.format = format
+        self.owns_file = isinstance(file, str)
+        self.file: BinaryIO = open(file, 'wb') if self.owns_file else file
+        self.n_frames = 0
+        if format == 'npy':
+            self.file.write(self._header())
+
+    def write(self, frame: np.ndarray):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame of shape {frame.shape} does not match {self.frame_shape}")
+        if self.dtype == np.uint8:
+            frame = to_uint8(frame)
+        self.file.write(np.ascontiguousarray(frame, dtype=self.dtype).tobytes())
+        self.n_frames += 1
+
+    def close(self):
+        if self.format == 'npy':
+            self.file.seek(0)
+            self.file.write(self._header())
+            self.file.seek(0, 2)
+        self.file.flush()
+        if self.owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _header(self) -> bytes:
+        header = repr({
+            'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+            'shape': (self.n_frames,) + self.frame_shape
+        })
+        # magic string, version and header length take 10 bytes, the header ends in a newline
+        prefix_size = 10
+        if len(header) + 1 > self.HEADER_SIZE - prefix_size:
+            raise ValueError(f"Frame shape {self.frame_shape} does not fit into the .npy header")
+        header = header.ljust(self.HEADER_SIZE - prefix_size - 1) + '\n'
+        return np.lib.format.magic(1, 0) + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+# collapses the cells of update_grid one by one, at positions or in scanline order, and writes a frame of
+# display_grid, which update_grid writes through (e.g. its super grid), after every `every` collapses and at the end
+def record_collapse(update_grid: Grid, display_grid: Grid, writer: FrameWriter,
+                    positions: Optional[Iterable[Pos]] = None, every: int = 1) -> np.ndarray:
+    renderer = FrameRenderer(display_grid)
+    writer.write(renderer.frame)
+    step = 0
+    for step, pos in enumerate(update_grid.pos_iterator if positions is None else positions, 1):
+        update_grid.propagated_collapse(pos)
+        renderer.update()
+        if step % every == 0:
+            writer.write(renderer.frame)
+    if step % every != 0:
+        writer.write(renderer.frame)
+    return renderer.frame
@@ -0,0 +1,154 @@
+import itertools
+from dataclasses import dataclass
+from multiprocessing import Pool, shared_memory
+from typing import Type, Tuple, Optional, List
+
+import numpy as np
+
+from ensemble import EnsembleOptions
+from grid.contradiction import Contradiction
+from grid.domain import UNCOLLAPSED
+from grid.grid_array import GridArray
+from grid.grid_boundary import ConstantGridBoundary, TileArrayBoundary
+from tiles import bitset
+from tiles.compiled import CompiledTileSet
+from tiles.shared import SharedTileSet, SharedTileSetHandle, attach_untracked
+from tileset import TileSet
+
+
+# a window of the grid to solve in a worker; only the core part of the solution is written back
+# with fixed_border the window is solved against the tiles already written around it, otherwise against open borders
+@dataclass
+class WindowTask:
+    lo: Tuple[int, ...]
+    hi: Tuple[int, ...]
+    core_lo: Tuple[int, ...]
+    core_hi: Tuple[int, ...]
+    fixed_border: bool
+    seed: np.random.SeedSequence
+
+
+# the tileset and the tile id array of the whole grid live in shared memory, attached by the pool initializer
+_worker_state = {}
+
+
+def _init_worker(handle: SharedTileSetHandle, tile_ids_name: str, shape: Tuple[int, ...], options: EnsembleOptions):
+    memory = attach_untracked(tile_ids_name)
+    _worker_state.update(
+        shared=SharedTileSet.attach(handle), memory=memory,
+        tile_ids=np.ndarray(shape, dtype=np.int16, buffer=memory.buf), options=options
+    )
+
+
+def read_border(tile_ids: np.ndarray, lo: Tuple[int, ...], hi: Tuple[int, ...]) -> np.ndarray:
+    # the tile ids around the window lo <= pos < hi, padded by one cell, for a TileArrayBoundary
+    shape = tuple(h - l for l, h in zip(lo, hi))
+    border = np.full(tuple(s + 2 for s in shape), UNCOLLAPSED, dtype=np.int16)
+    src = tuple(slice(max(l - 1, 0), min(h + 1, n)) for l, h, n in zip(lo, hi, tile_ids.shape))
+    border[tuple(slice(s.start - l + 1, s.stop - l + 1) for s, l in zip(src, lo))] = tile_ids[src]
+    border[tuple(slice(1, -1) for _ in shape)] = UNCOLLAPSED
+    return border
+
+
+# solves a region against the tile ids around it (see read_border), or against open borders if border is None
+def solve_region(compiled: CompiledTileSet, shape: Tuple[int, ...], border: Optional[np.ndarray],
+                 rng: np.random.Generator, options: EnsembleOptions) -> Optional[np.ndarray]:
+    if border is None:
+        boundary = ConstantGridBoundary.from_domain(bitset.full(compiled.n_tiles))
+    else:
+        boundary = TileArrayBoundary(border)
+    for attempt in range(options.max_attempts):
+        try:
+            grid = GridArray(shape, boundary, tile_data=None, compiled=compiled,
+                             propagator_factory=options.propagator_factory, rng=rng)
+            grid.propagate_boundary()
+            if options.max_backtracks > 0:
+                grid.backtracking_collapse(options.max_backtracks, options.min_entropy)
+            elif options.min_entropy:
+                grid.min_entropy_collapse()
+            else:
+                grid.scanline_collapse()
+        except Contradiction:
+            continue
+        return grid.collapsed.copy()
+    return None
+
+
+def solve_window(task: WindowTask) -> bool:
+    shared, tile_ids, options = (_worker_state[k] for k in ('shared', 'tile_ids', 'options'))
+    shape = tuple(h - l for l, h in zip(task.lo, task.hi))
+    border = read_border(tile_ids, task.lo, task.hi) if task.fixed_border else None
+    solution = solve_region(shared.compiled, shape, border, np.random.default_rng(task.seed), options)
+    if solution is None:
+        return False
+    core = tuple(slice(l - w, h - w) for l, h, w in zip(task.core_lo, task.core_hi, task.lo))
+    tile_ids[tuple(slice(l, h) for l, h in zip(task.core_lo, task.core_hi))] = solution[core]
+    return True
+
+
+def split_blocks(shape: Tuple[int, ...], block_shape: Tuple[int, ...]) -> List[Tuple[Tuple[int, ...], ...]]:
+    return [
+        (index, tuple(i * b for i, b in zip(index, block_shape)),
+         tuple(min((i + 1) * b, n) for i, b, n in zip(index, block_shape, shape)))
+        for index in itertools.product(*(range(-(-n // b)) for n, b in zip(shape, block_shape)))
+    ]
+
+
+def grow_window(lo: Tuple[int, ...], hi: Tuple[int, ...], margin: int, shape: Tuple[int, ...]):
+    return tuple(max(l - margin, 0) for l in lo), tuple(min(h + margin, n) for h, n in zip(hi, shape))
+
+
+# checkerboard domain decomposition of a large grid with open (any tile) borders
+# blocks are colored by the parity of their index along every axis and the colors are solved one after the other,
+# the blocks of one color concurrently: they are at least one block apart, so with 2 * margin smaller than the block
+# shape neither their windows nor the borders around them overlap
+# the first color is solved against open borders, each over a window reaching margin cells into its neighbors so that
+# its own border is likely to be extendable; only the block itself is kept
+# the blocks of every later color are solved over the same window against all the tiles fixed around it, re-solving
+# the bands of the neighboring blocks solved before so that the seams are resolved against both sides
+# a block that fails is re-solved on its own with a wider band, up to max_repairs times
+def solve_decomposed(tileset_class: Type[TileSet], shape: Tuple[int, ...], block_shape: Tuple[int, ...], seed: int,
+                     margin: int = 2, max_repairs: int = 3, options: Optional[EnsembleOptions] = None,
+                     processes: Optional[int] = None) -> np.ndarray:
+    if any(2 * margin >= b for b, n in zip(block_shape, shape) if b < n):
+        raise ValueError(f"Margin {margin} must be smaller than half the block shape {block_shape}")
+    options = EnsembleOptions(max_backtracks=1000) if options is None else options
+    seed_sequence = np.random.SeedSequence(seed)
+    colors = {}
+    for index, lo, hi in split_blocks(shape, block_shape):
+        colors.setdefault(tuple(i % 2 for i in index), []).append((lo, hi))
+
+    memory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 2, 1))
+    try:
+        tile_ids = np.ndarray(shape, dtype=np.int16, buffer=memory.buf)
+        tile_ids[...] = UNCOLLAPSED
+        with SharedTileSet.publish(tileset_class().compiled) as shared:
+            init_args = (shared.handle, memory.name, shape, options)
+            with Pool(processes, initializer=_init_worker, initargs=init_args) as pool:
+                for phase, color in enumerate(sorted(colors)):
+                    blocks = colors[color]
+                    seeds = seed_sequence.spawn(len(blocks))
+                    tasks = []
+                    for (lo, hi), block_seed in zip(blocks, seeds):
+                        window_lo, window_hi = grow_window(lo, hi, margin, shape)
+                        if phase == 0:
+                            tasks.append(WindowTask(window_lo, window_hi, lo, hi, False, block_seed))
+                        else:
+                            tasks.append(WindowTask(window_lo, window_hi, window_lo, window_hi, True, block_seed))
+                    solved = pool.map(solve_window, tasks)
+
+                    # repair windows are wider than the spacing of the blocks, so they are solved one at a time
+                    for (lo, hi), block_seed, ok in zip(blocks, seeds, solved):
+                        repair = 1
+                        while not ok:
+                            if repair > max_repairs:
+                                raise Contradiction()
+                            window_lo, window_hi = grow_window(lo, hi, (repair + 1) * margin, shape)
+                            ok = pool.apply(solve_window, (
+                                WindowTask(window_lo, window_hi, window_lo, window_hi, True, block_seed.spawn(1)[0]),
+                            ))
+                            repair += 1
+        return tile_ids.copy()
+    finally:
+        memory.close()
+        memory.unlink()
@@ -0,0 +1,285 @@
+import argparse
+import importlib
+import itertools
+import json
+import socket
+import struct
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing import Process
+from typing import Type, Tuple, Optional, List, Dict, Deque
+
+import numpy as np
+
+import propagator
+from decomposition import read_border, solve_region, split_blocks, grow_window
+from ensemble import EnsembleOptions
+from grid.contradiction import Contradiction
+from grid.domain import UNCOLLAPSED
+from tileset import TileSet
+
+# Chunk jobs of a checkerboard decomposition (see decomposition.solve_decomposed) spread over workers that connect
+# to a coordinator over TCP.
+# Messages are a big-endian (header length, payload length) pair, a JSON header and an optional little-endian int16
+# tile id array whose shape is given by the header's 'shape'.
+#   worker -> coordinator  {'type': 'hello'}
+#   coordinator -> worker  {'type': 'setup', 'tileset': 'module:Class', 'options': {...}}
+#   coordinator -> worker  {'type': 'job', 'id', 'window', 'core_lo', 'core_hi', 'seed'} [+ border tile ids]
+#   worker -> coordinator  {'type': 'result', 'id', 'ok'} [+ core tile ids]
+#   coordinator -> worker  {'type': 'done'}
+
+_HEADER = struct.Struct('>II')
+
+
+def send_message(sock: socket.socket, header: dict, payload: Optional[np.ndarray] = None):
+    data = b''
+    if payload is not None:
+        header = dict(header, shape=list(payload.shape))
+        data = np.ascontiguousarray(payload, dtype='<i2').tobytes()
+    body = json.dumps(header).encode()
+    sock.sendall(_HEADER.pack(len(body), len(data)) + body + data)
+
+
+def recv_message(sock: socket.socket) -> Tuple[dict, Optional[np.ndarray]]:
+    header_length, data_length = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    header = json.loads(_recv_exactly(sock, header_length))
+    data = _recv_exactly(sock, data_length)
+    if 'shape' not in header:
+        return header, None
+    return header, np.frombuffer(data, dtype='<i2').astype(np.int16).reshape(header['shape'])
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+# the window lo <= pos < hi is solved and its core written back; a job can only start once the jobs writing to
+# the window or the border around it have finished
+@dataclass
+class ChunkJob:
+    id: int
+    block_lo: Tuple[int, ...]
+    block_hi: Tuple[int, ...]
+    lo: Tuple[int, ...]
+    hi: Tuple[int, ...]
+    core_lo: Tuple[int, ...]
+    core_hi: Tuple[int, ...]
+    fixed_border: bool
+    seed: np.random.SeedSequence
+    dependents: List[int] = field(default_factory=list)
+    n_dependencies: int = 0
+    repair: int = 0
+
+
+class Coordinator:
+    def __init__(self, tileset_class: Type[TileSet], shape: Tuple[int, ...], block_shape: Tuple[int, ...],
+                 seed: int, margin: int = 2, max_repairs: int = 3, options: Optional[EnsembleOptions] = None,
+                 host: str = '127.0.0.1', port: int = 0, job_timeout: float = 60.):
+        if any(2 * margin >= b for b, n in zip(block_shape, shape) if b < n):
+            raise ValueError(f"Margin {margin} must be smaller than half the block shape {block_shape}")
+        self.tileset_path = f"{tileset_class.__module__}:{tileset_class.__qualname__}"
+        self.shape = shape
+        self.margin = margin
+        self.max_repairs = max_repairs
+        self.options = EnsembleOptions(max_backtracks=1000) if options is None else options
+        self.job_timeout = job_timeout
+        self.tile_ids = np.full(shape, UNCOLLAPSED, dtype=np.int16)
+        self.jobs = self._build_jobs(shape, block_shape, np.random.SeedSequence(seed))
+
+        self.condition = threading.Condition()
+        self.ready: Deque[ChunkJob] = deque(job for job in self.jobs if job.n_dependencies == 0)
+        # a failed job is re-solved over a wider window that may overlap any other job, so it runs alone
+        self.repairs: Deque[ChunkJob] = deque()
+        self.running: Dict[int, ChunkJob] = {}
+        self.n_done = 0
+        self.error: Optional[Exception] = None
+
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.1)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.getsockname()[:2]
+
+    @property
+    def finished(self) -> bool:
+        return self.n_done == len(self.jobs) or self.error is not None
+
+    def _build_jobs(self, shape, block_shape, seed_sequence: np.random.SeedSequence) -> List[ChunkJob]:
+        colors = {}
+        for index, lo, hi in split_blocks(shape, block_shape):
+            colors.setdefault(tuple(i % 2 for i in index), []).append((index, lo, hi))
+        jobs, job_index = [], {}
+        for phase, color in enumerate(sorted(colors)):
+            blocks = colors[color]
+            for (index, lo, hi), job_seed in zip(blocks, seed_sequence.spawn(len(blocks))):
+                window_lo, window_hi = grow_window(lo, hi, self.margin, shape)
+                if phase == 0:
+                    job = ChunkJob(len(jobs), lo, hi, window_lo, window_hi, lo, hi, False, job_seed)
+                else:
+                    job = ChunkJob(len(jobs), lo, hi, window_lo, window_hi, window_lo, window_hi, True, job_seed)
+                # with 2 * margin below the block shape only the adjacent blocks can write to the border of a window
+                for offset in itertools.product((-1, 0, 1), repeat=len(shape)):
+                    other = job_index.get(tuple(i + o for i, o in zip(index, offset)))
+                    if other is not None and _overlap(other.core_lo, other.core_hi, *grow_window(
+                            window_lo, window_hi, 1, shape)):
+                        other.dependents.append(job.id)
+                        job.n_dependencies += 1
+                job_index[index] = job
+                jobs.append(job)
+        return jobs
+
+    def run(self) -> np.ndarray:
+        threads = []
+        try:
+            while True:
+                with self.condition:
+                    if self.finished:
+                        break
+                try:
+                    conn, _ = self.server.accept()
+                except socket.timeout:
+                    continue
+                thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+                thread.start()
+                threads.append(thread)
+        finally:
+            with self.condition:
+                if self.error is None and self.n_done < len(self.jobs):
+                    self.error = RuntimeError("Coordinator stopped")
+                self.condition.notify_all()
+            for thread in threads:
+                thread.join(self.job_timeout)
+            self.server.close()
+        if self.n_done < len(self.jobs):
+            raise self.error
+        return self.tile_ids
+
+    def _serve(self, conn: socket.socket):
+        job = None
+        try:
+            conn.settimeout(self.job_timeout)
+            recv_message(conn)
+            send_message(conn, {'type': 'setup', 'tileset': self.tileset_path, 'options': {
+                'max_attempts': self.options.max_attempts,
+                'max_backtracks': self.options.max_backtracks,
+                'min_entropy': self.options.min_entropy,
+                'propagator': self.options.propagator_factory.__name__
+            }})
+            while True:
+                job, border = self._next_job()
+                if job is None:
+                    send_message(conn, {'type': 'done'})
+                    return
+                send_message(conn, {
+                    'type': 'job', 'id': job.id, 'window': [h - l for l, h in zip(job.lo, job.hi)],
+                    'core_lo': [c - l for c, l in zip(job.core_lo, job.lo)],
+                    'core_hi': [c - l for c, l in zip(job.core_hi, job.lo)],
+                    'seed': {'entropy': job.seed.entropy, 'spawn_key': list(job.seed.spawn_key)}
+                }, border)
+                header, core = recv_message(conn)
+                if header.get('id') != job.id:
+                    raise ConnectionError(f"Unexpected message {header}")
+                self._complete(job, header['ok'], core)
+                job = None
+        except (OSError, ValueError):
+            # lost or misbehaving worker: hand its job to the next one
+            if job is not None:
+                self._requeue(job)
+        finally:
+            conn.close()
+
+    def _next_job(self) -> Tuple[Optional[ChunkJob], Optional[np.ndarray]]:
+        with self.condition:
+            while not self.finished:
+                job = None
+                if len(self.repairs) > 0:
+                    if len(self.running) == 0:
+                        job = self.repairs.popleft()
+                elif len(self.ready) > 0:
+                    job = self.ready.popleft()
+                if job is not None:
+                    self.running[job.id] = job
+                    # the border is read when the job is sent, which its dependencies guarantee is final
+                    return job, read_border(self.tile_ids, job.lo, job.hi) if job.fixed_border else None
+                self.condition.wait()
+            return None, None
+
+    def _complete(self, job: ChunkJob, ok: bool, core: Optional[np.ndarray]):
+        with self.condition:
+            del self.running[job.id]
+            if ok:
+                self.tile_ids[tuple(slice(l, h) for l, h in zip(job.core_lo, job.core_hi))] = core
+                self.n_done += 1
+                for dependent in job.dependents:
+                    self.jobs[dependent].n_dependencies -= 1
+                    if self.jobs[dependent].n_dependencies == 0:
+                        self.ready.append(self.jobs[dependent])
+            elif job.repair >= self.max_repairs:
+                self.error = Contradiction()
+            else:
+                lo, hi = grow_window(job.block_lo, job.block_hi, (job.repair + 2) * self.margin, self.shape)
+                self.repairs.append(ChunkJob(
+                    job.id, job.block_lo, job.block_hi, lo, hi, lo, hi, True, job.seed.spawn(1)[0],
+                    job.dependents, 0, job.repair + 1
+                ))
+                self.jobs[job.id] = self.repairs[-1]
+            self.condition.notify_all()
+
+    def _requeue(self, job: ChunkJob):
+        with self.condition:
+            del self.running[job.id]
+            (self.repairs if job.repair > 0 else self.ready).appendleft(job)
+            self.condition.notify_all()
+
+
+def _overlap(lo_a, hi_a, lo_b, hi_b) -> bool:
+    return all(max(la, lb) < min(ha, hb) for la, ha, lb, hb in zip(lo_a, hi_a, lo_b, hi_b))
+
+
+def run_worker(host: str, port: int):
+    with socket.create_connection((host, port)) as sock:
+        send_message(sock, {'type': 'hello'})
+        setup, _ = recv_message(sock)
+        module, name = setup['tileset'].split(':')
+        compiled = getattr(importlib.import_module(module), name)().compiled
+        options = EnsembleOptions(
+            max_attempts=setup['options']['max_attempts'],
+            max_backtracks=setup['options']['max_backtracks'],
+            min_entropy=setup['options']['min_entropy'],
+            propagator_factory=getattr(propagator, setup['options']['propagator'])
+        )
+        while True:
+            header, border = recv_message(sock)
+            if header['type'] == 'done':
+                return
+            rng = np.random.default_rng(np.random.SeedSequence(**header['seed']))
+            solution = solve_region(compiled, tuple(header['window']), border, rng, options)
+            if solution is None:
+                send_message(sock, {'type': 'result', 'id': header['id'], 'ok': False})
+            else:
+                core = tuple(slice(l, h) for l, h in zip(header['core_lo'], header['core_hi']))
+                send_message(sock, {'type': 'result', 'id': header['id'], 'ok': True}, solution[core])
+
+
+def start_local_workers(address: Tuple[str, int], n: int) -> List[Process]:
+    workers = [Process(target=run_worker, args=address, daemon=True) for _ in range(n)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Worker solving chunk jobs for a distributed coordinator")
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    args = parser.parse_args()
+    run_worker(args.host, args.port)
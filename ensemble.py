@@ -0,0 +1,94 @@
+import time
+from dataclasses import dataclass
+from multiprocessing import Pool
+from typing import Type, Tuple, Callable, Iterable, List, Optional
+
+import numpy as np
+
+from grid.contradiction import Contradiction
+from grid.grid_array import GridArray
+from grid.grid_boundary import GridBoundary, ConstantGridBoundary, PeriodicGridBoundary
+from grid.initial_state import InitialStateCache
+from propagator import Propagator
+from tiles import bitset
+from tiles.compiled import CompiledTileSet
+from tiles.shared import SharedTileSet, SharedTileSetHandle
+from tileset import TileSet
+
+
+# boundary factories are called inside the workers, so they must be module level functions to be picklable
+def any_tile_boundary(compiled: CompiledTileSet) -> GridBoundary:
+    return ConstantGridBoundary.from_domain(bitset.full(compiled.n_tiles))
+
+
+def periodic_boundary(compiled: CompiledTileSet) -> GridBoundary:
+    return PeriodicGridBoundary()
+
+
+@dataclass
+class EnsembleOptions:
+    max_attempts: int = 10
+    max_backtracks: int = 0
+    min_entropy: bool = True
+    propagator_factory: Callable = Propagator
+    # every run starts from the propagated initial state of the grid, computed once per worker, or once overall if
+    # a directory to share it through is given
+    initial_state_directory: Optional[str] = None
+
+
+@dataclass
+class RunResult:
+    seed: int
+    tile_ids: Optional[np.ndarray]
+    attempts: int
+    backtracks: int
+    seconds: float
+
+    @property
+    def succeeded(self) -> bool:
+        return self.tile_ids is not None
+
+
+# the tileset is compiled once by the parent and attached read-only by each worker in the pool initializer
+_worker_state = {}
+
+
+def _init_worker(handle: SharedTileSetHandle, shape: Tuple[int, ...],
+                 boundary_factory: Callable[[CompiledTileSet], GridBoundary], options: EnsembleOptions):
+    shared = SharedTileSet.attach(handle)
+    _worker_state.update(
+        shared=shared, shape=shape, boundary=boundary_factory(shared.compiled), options=options,
+        initial_states=InitialStateCache(options.initial_state_directory)
+    )
+
+
+def run_seed(seed: int) -> RunResult:
+    shared, shape, boundary, options, initial_states = (
+        _worker_state[k] for k in ('shared', 'shape', 'boundary', 'options', 'initial_states')
+    )
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    backtracks = 0
+    for attempt in range(1, options.max_attempts + 1):
+        grid = GridArray(shape, boundary=boundary, tile_data=None, compiled=shared.compiled,
+                         propagator_factory=options.propagator_factory, rng=rng, initial_states=initial_states)
+        try:
+            if options.max_backtracks > 0:
+                backtracks += grid.backtracking_collapse(options.max_backtracks, options.min_entropy)
+            elif options.min_entropy:
+                grid.min_entropy_collapse()
+            else:
+                grid.scanline_collapse()
+        except Contradiction:
+            continue
+        return RunResult(seed, grid.collapsed.copy(), attempt, backtracks, time.perf_counter() - start)
+    return RunResult(seed, None, options.max_attempts, backtracks, time.perf_counter() - start)
+
+
+def generate_ensemble(tileset_class: Type[TileSet], shape: Tuple[int, ...], seeds: Iterable[int],
+                      boundary_factory: Callable[[CompiledTileSet], GridBoundary] = any_tile_boundary,
+                      options: Optional[EnsembleOptions] = None, processes: Optional[int] = None) -> List[RunResult]:
+    with SharedTileSet.publish(tileset_class().compiled) as shared:
+        init_args = (shared.handle, shape, boundary_factory, EnsembleOptions() if options is None else options)
+        with Pool(processes, initializer=_init_worker, initargs=init_args) as pool:
+            return pool.map(run_seed, seeds)
@@ -3,6 +3,7 @@ from typing import Set
 
 import numpy as np
 
+from grid.contradiction import Contradiction
 from tiles.data import random_tile
 from tiles.graphics import TileGraphics, TilePixels
 from tiles.names import TileNames
@@ -18,7 +19,7 @@ class Cell(ABC):
         pass
 
     @abstractmethod
-    def collapse(self):
+    def collapse(self, rng=np.random):
         pass
 
     @abstractmethod
@@ -41,7 +42,7 @@ class UncollapsedCell(Cell):
 
     @classmethod
     def with_any_tile(cls, tileset: TileSet):
-        return UncollapsedCell(tileset.tile_data, {t for t in tileset.tile_name_enum})
+        return UncollapsedCell(tileset.tile_data, tileset.any_tile)
 
     @classmethod
     def excluding_tiles(cls, tileset: TileSet, excluded_tiles: Set[TileNames]):
@@ -56,13 +57,13 @@ class UncollapsedCell(Cell):
     def entropy(self):
         return len(self.tiles)
 
-    def collapse(self):
-        return CollapsedCell(self.tile_data, random_tile(self.tile_data, self.tiles))
+    def collapse(self, rng=np.random):
+        return CollapsedCell(self.tile_data, random_tile(self.tile_data, self.tiles, rng))
 
     def constrain(self, tiles):
         self.tiles = self.tiles.intersection(tiles)
         if len(self.tiles) == 0:
-            raise Exception("Unsatisfiable configuration")
+            raise Contradiction()
         if len(self.tiles) == 1:
             return CollapsedCell(self.tile_data, [t for t in self.tiles][0])
         return self
@@ -86,12 +87,12 @@ class CollapsedCell(Cell):
     def entropy(self):
         return 0
 
-    def collapse(self):
+    def collapse(self, rng=np.random):
         return self
 
     def constrain(self, tiles):
         if self.tile not in tiles:
-            raise Exception("Unsatisfiable configuration")
+            raise Contradiction()
         return self
 
     def get_compatible_tiles(self, direction):
@@ -0,0 +1,152 @@
+import itertools
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Tuple, Callable, Optional, Dict
+
+import numpy as np
+
+from grid.cell import Cell
+from grid.contradiction import Contradiction
+from grid.grid import Grid
+from grid.grid_array import GridArray
+from grid.grid_boundary import GridBoundary
+from grid.pos import Pos
+from propagator import Propagator
+from tiles import bitset
+from tiles.compiled import CompiledTileSet
+
+ChunkCoords = Tuple[int, ...]
+
+
+# boundary of a chunk being generated: cells of already generated neighbor chunks are fixed, everything else is open
+class ChunkBoundary(GridBoundary):
+    def __init__(self, world: "ChunkedWorld", coords: ChunkCoords):
+        self.world = world
+        self.coords = coords
+        self.neighbor_chunks: Dict[ChunkCoords, Optional[np.ndarray]] = {}
+
+    def map_pos(self, grid, pos: Pos) -> Optional[Pos]:
+        self.error_if_in_bounds(grid, pos)
+        return None
+
+    def get_cell(self, grid, pos: Pos) -> Cell:
+        return grid.domain_to_cell(self.get_domain(grid, pos))
+
+    def get_domain(self, grid, pos: Pos) -> np.ndarray:
+        self.error_if_in_bounds(grid, pos)
+        world_pos = tuple(c * s + p for c, s, p in zip(self.coords, self.world.chunk_shape, pos))
+        coords, local_pos = self.world.split_pos(world_pos)
+        if coords not in self.neighbor_chunks:
+            self.neighbor_chunks[coords] = self.world.peek_chunk(coords)
+        chunk = self.neighbor_chunks[coords]
+        if chunk is None:
+            return self.world.any_tile
+        return self.world.tile_words[chunk[local_pos]]
+
+
+# unbounded world made of fixed size chunks that are generated on demand
+# a chunk only depends on the world seed, its coordinates and the borders of the neighbor chunks generated before it
+# at most max_chunks chunks are held in memory, least recently used ones are written to directory and reloaded from
+# there when needed again
+class ChunkedWorld:
+    def __init__(self, compiled: CompiledTileSet, chunk_shape: Tuple[int, ...], world_seed: int,
+                 directory: Optional[str] = None, max_chunks: int = 64,
+                 propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                 max_attempts: int = 10, max_backtracks: int = 1000):
+        self.compiled = compiled
+        self.chunk_shape = tuple(chunk_shape)
+        self.world_seed = world_seed
+        self.directory = tempfile.mkdtemp(prefix='wfc_chunks_') if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_chunks = max_chunks
+        self.propagator_factory = propagator_factory
+        self.max_attempts = max_attempts
+        self.max_backtracks = max_backtracks
+        self.cache: OrderedDict[ChunkCoords, np.ndarray] = OrderedDict()
+        self.any_tile = bitset.full(compiled.n_tiles)
+        self.tile_words = bitset.from_bool(np.eye(compiled.n_tiles, dtype=bool))
+
+    def split_pos(self, world_pos: Pos) -> Tuple[ChunkCoords, Pos]:
+        return (
+            tuple(p // s for p, s in zip(world_pos, self.chunk_shape)),
+            tuple(p % s for p, s in zip(world_pos, self.chunk_shape))
+        )
+
+    def get_tile(self, world_pos: Pos) -> int:
+        coords, local_pos = self.split_pos(world_pos)
+        return self.get_chunk(coords)[local_pos]
+
+    def region(self, lo: Pos, hi: Pos) -> np.ndarray:
+        # tile ids of the world positions lo <= pos < hi, generating the chunks it touches
+        out = np.empty(tuple(h - l for l, h in zip(lo, hi)), dtype=np.int16)
+        lo_coords, _ = self.split_pos(lo)
+        hi_coords, _ = self.split_pos(tuple(h - 1 for h in hi))
+        for coords in itertools.product(*(range(a, b + 1) for a, b in zip(lo_coords, hi_coords))):
+            chunk = self.get_chunk(coords)
+            origin = tuple(c * s for c, s in zip(coords, self.chunk_shape))
+            src = tuple(slice(max(l - o, 0), min(h - o, s)) for l, h, o, s in zip(lo, hi, origin, self.chunk_shape))
+            dst = tuple(slice(o + sl.start - l, o + sl.stop - l) for sl, o, l in zip(src, origin, lo))
+            out[dst] = chunk[src]
+        return out
+
+    def get_chunk(self, coords: ChunkCoords) -> np.ndarray:
+        coords = tuple(coords)
+        chunk = self.peek_chunk(coords)
+        if chunk is None:
+            chunk = self.generate_chunk(coords)
+            self._store(coords, chunk)
+        return chunk
+
+    def peek_chunk(self, coords: ChunkCoords) -> Optional[np.ndarray]:
+        # an already generated chunk, from memory or disk, without generating it
+        if coords in self.cache:
+            self.cache.move_to_end(coords)
+            return self.cache[coords]
+        path = self._path(coords)
+        if os.path.exists(path):
+            chunk = np.load(path)
+            self._store(coords, chunk)
+            return chunk
+        return None
+
+    def generate_chunk(self, coords: ChunkCoords) -> np.ndarray:
+        rng = np.random.default_rng(np.random.SeedSequence(self.world_seed, spawn_key=tuple(_zigzag(c) for c in coords)))
+        boundary = ChunkBoundary(self, coords)
+        for attempt in range(self.max_attempts):
+            try:
+                grid = GridArray(self.chunk_shape, boundary, tile_data=None, compiled=self.compiled,
+                                 propagator_factory=self.propagator_factory, rng=rng)
+                grid.propagate_boundary()
+                if self.max_backtracks > 0:
+                    grid.backtracking_collapse(self.max_backtracks)
+                else:
+                    grid.min_entropy_collapse()
+            except Contradiction:
+                continue
+            return grid.collapsed.copy()
+        raise Contradiction()
+
+    def flush(self):
+        for coords, chunk in self.cache.items():
+            self._save(coords, chunk)
+
+    def _store(self, coords: ChunkCoords, chunk: np.ndarray):
+        self.cache[coords] = chunk
+        self.cache.move_to_end(coords)
+        while len(self.cache) > self.max_chunks:
+            self._save(*self.cache.popitem(last=False))
+
+    def _save(self, coords: ChunkCoords, chunk: np.ndarray):
+        # chunks never change once generated, so a chunk already on disk is not written again
+        path = self._path(coords)
+        if not os.path.exists(path):
+            np.save(path, chunk)
+
+    def _path(self, coords: ChunkCoords) -> str:
+        return os.path.join(self.directory, 'chunk_' + '_'.join(str(c) for c in coords) + '.npy')
+
+
+# maps integers to non-negative integers, as SeedSequence spawn keys must be
+def _zigzag(n: int) -> int:
+    return 2 * n if n >= 0 else -2 * n - 1
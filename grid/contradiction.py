@@ -0,0 +1,25 @@
+from typing import Optional, List
+
+from grid.pos import Pos
+
+
+class Contradiction(Exception):
+    def __init__(self, pos: Optional[Pos] = None):
+        super().__init__("Unsatisfiable configuration" if pos is None else f"Unsatisfiable configuration at {pos}")
+        self.pos = pos
+
+    # keeps pos when raised in a worker process and pickled back
+    def __reduce__(self):
+        return Contradiction, (self.pos,)
+
+
+# raised by Grid.pin when pins cannot all be applied; pins are the positions of a smallest subset of them that
+# already contradicts the grid (every one of them is needed for the contradiction), pos is where it showed up
+class PinContradiction(Contradiction):
+    def __init__(self, pins: List[Pos], pos: Optional[Pos] = None):
+        super().__init__(pos)
+        self.args = (f"{self.args[0]}, conflicting pins {pins}",)
+        self.pins = pins
+
+    def __reduce__(self):
+        return PinContradiction, (self.pins, self.pos)
@@ -0,0 +1,96 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+
+# array indexed by cell along axis 0 that forks copy-on-write, for per-cell state kept next to CowDomainArray
+# a fork freezes the array as a base shared with the other forks, and each of them keeps the rows it changed since;
+# the changes are folded into a new array of its own once there are more than max_changes of them
+# supports the indexing the propagators and entropy heuristics use: a cell, an array of cells, and either of them
+# followed by an index into the row
+class CowArray:
+    def __init__(self, array: np.ndarray, max_changes: Optional[int] = None):
+        self.array: Optional[np.ndarray] = array
+        self.base: Optional[np.ndarray] = None
+        self.changes: Optional[Dict[int, np.ndarray]] = None
+        self.max_changes = max(len(array) // 4, 64) if max_changes is None else max_changes
+
+    @property
+    def shape(self):
+        return (self.array if self.base is None else self.base).shape
+
+    @property
+    def dtype(self):
+        return (self.array if self.base is None else self.base).dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def fork(self) -> "CowArray":
+        if self.changes is None:
+            self.array.setflags(write=False)
+            self.base, self.array, self.changes = self.array, None, {}
+        else:
+            # rows shared with the fork are copied again before either of them writes to them
+            for row in self.changes.values():
+                row.setflags(write=False)
+        fork = CowArray.__new__(CowArray)
+        fork.array, fork.base, fork.changes, fork.max_changes = None, self.base, dict(self.changes), self.max_changes
+        return fork
+
+    def materialize(self):
+        array = self.base.copy()
+        for i, row in self.changes.items():
+            array[i] = row
+        self.array, self.base, self.changes = array, None, None
+
+    def _row(self, i: int) -> np.ndarray:
+        row = self.changes.get(i)
+        return self.base[i] if row is None else row
+
+    def _own(self, i: int) -> np.ndarray:
+        row = self.changes.get(i)
+        if row is None or not row.flags.writeable:
+            row = np.array(self._row(i))
+            self.changes[i] = row
+        return row
+
+    def __getitem__(self, index):
+        if self.changes is None:
+            return self.array[index]
+        cells, rest = (index[0], index[1:]) if isinstance(index, tuple) else (index, ())
+        if isinstance(cells, (int, np.integer)):
+            row = self.changes.get(int(cells))
+            if row is None or not row.flags.writeable:
+                # a copy, so that in-place operators write back through __setitem__
+                row = np.array(self._row(int(cells)))
+            return row[rest]
+        rows = np.array([self._row(i) for i in np.asarray(cells).tolist()], dtype=self.dtype) \
+            .reshape((len(cells),) + self.shape[1:])
+        return rows if len(rest) == 0 else rows[(np.arange(len(cells)),) + rest]
+
+    def __setitem__(self, index, value):
+        if self.changes is None:
+            self.array[index] = value
+            return
+        cells, rest = (index[0], index[1:]) if isinstance(index, tuple) else (index, ())
+        if isinstance(cells, (int, np.integer)):
+            self._own(int(cells))[rest] = value
+        else:
+            # index arrays after the cells are paired with them, as in numpy
+            cells = np.asarray(cells).tolist()
+            if np.ndim(value) == 0 or len(value) != len(cells):
+                value = [value] * len(cells)
+            rest = [r.tolist() if isinstance(r, np.ndarray) else [r] * len(cells) for r in rest]
+            for k, i in enumerate(cells):
+                self._own(i)[tuple(r[k] for r in rest)] = value[k]
+        if len(self.changes) > self.max_changes:
+            self.materialize()
+
+    def __array__(self, dtype=None):
+        if self.changes is None:
+            return np.asarray(self.array, dtype=dtype)
+        array = self.base.copy()
+        for i, row in self.changes.items():
+            array[i] = row
+        return np.asarray(array, dtype=dtype)
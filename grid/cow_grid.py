@@ -0,0 +1,38 @@
+from typing import Tuple, Callable, Optional
+
+import numpy as np
+
+from grid.domain import CowDomainArray, DomainArray
+from grid.entropy import EntropyHeuristic, CountEntropy
+from grid.grid import Grid
+from grid.grid_array import GridArray
+from grid.grid_boundary import GridBoundary
+from grid.initial_state import InitialStateCache
+from propagator import Propagator
+from tiles.compiled import CompiledTileSet
+
+
+# GridArray storing its domains in a CowDomainArray from the start: a fresh grid shares one initial domain between
+# all cells and only stores the cells that have been constrained, which suits grids that are forked often
+class CowGridArray(GridArray):
+
+    def __init__(self, shape: Tuple[int, ...], boundary: GridBoundary, tile_data, init_cell_factory=None,
+                 propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                 entropy_factory: Callable[[Grid], EntropyHeuristic] = CountEntropy,
+                 rng: Optional[np.random.Generator] = None, compiled: Optional[CompiledTileSet] = None,
+                 max_changes: Optional[int] = None, initial_states: Optional[InitialStateCache] = None):
+        self.max_changes = max_changes
+        super().__init__(shape, boundary, tile_data, init_cell_factory, propagator_factory, entropy_factory, rng,
+                         compiled, initial_states)
+        self.domains: CowDomainArray
+
+    def populate_grid(self, words: np.ndarray):
+        self.domains = CowDomainArray(self.shape, self.n_tiles, words, max_changes=self.max_changes)
+
+    def load_domains(self, domains: DomainArray):
+        # the domains become the shared base, so loading is free
+        self.domains = CowDomainArray(self.shape, self.n_tiles, self.domains.default, domains,
+                                      max_changes=self.max_changes)
+
+    def materialize(self):
+        self.domains.materialize()
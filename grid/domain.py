@@ -0,0 +1,256 @@
+import os
+import itertools
+from typing import Tuple, Optional, Dict
+
+import numpy as np
+
+from grid.pos import Pos
+from tiles import bitset
+
+UNCOLLAPSED = -1
+
+
+class DomainArray:
+    WORDS_FILE = 'words.npy'
+    COLLAPSED_FILE = 'collapsed.npy'
+
+    def __init__(self, shape: Tuple[int, ...], n_tiles: int, words: Optional[np.ndarray] = None,
+                 collapsed: Optional[np.ndarray] = None):
+        self.shape = shape
+        self.n_tiles = n_tiles
+        self.n_words = bitset.n_words(n_tiles)
+        self.words = np.zeros(shape + (self.n_words,), dtype=bitset.WORD_DTYPE) if words is None else words
+        self.collapsed = np.full(shape, UNCOLLAPSED, dtype=np.int16) if collapsed is None else collapsed
+
+    # domains kept in .npy files mapped into memory, opened as they are if resume is set and they exist
+    # the collapsed array doubles as the tile id output and can be read back with np.load
+    @classmethod
+    def open_memmap(cls, directory: str, shape: Tuple[int, ...], n_tiles: int, resume: bool = True) -> "DomainArray":
+        os.makedirs(directory, exist_ok=True)
+        words_path = os.path.join(directory, cls.WORDS_FILE)
+        collapsed_path = os.path.join(directory, cls.COLLAPSED_FILE)
+        if resume and os.path.exists(words_path) and os.path.exists(collapsed_path):
+            words = np.lib.format.open_memmap(words_path, mode='r+')
+            collapsed = np.lib.format.open_memmap(collapsed_path, mode='r+')
+            if words.shape != shape + (bitset.n_words(n_tiles),) or collapsed.shape != shape:
+                raise ValueError(f"Domains in {directory} do not match shape {shape} with {n_tiles} tiles")
+        else:
+            words = np.lib.format.open_memmap(
+                words_path, mode='w+', dtype=bitset.WORD_DTYPE, shape=shape + (bitset.n_words(n_tiles),)
+            )
+            collapsed = np.lib.format.open_memmap(collapsed_path, mode='w+', dtype=np.int16, shape=shape)
+        return cls(shape, n_tiles, words, collapsed)
+
+    @property
+    def is_memmap(self) -> bool:
+        return isinstance(self.words, np.memmap)
+
+    def get(self, pos: Pos) -> np.ndarray:
+        return self.words[pos]
+
+    def tile(self, pos: Pos) -> int:
+        return self.collapsed[pos]
+
+    def set(self, pos: Pos, words: np.ndarray):
+        self.words[pos] = words
+        tile_ids = bitset.unpack(words)
+        self.collapsed[pos] = tile_ids[0] if len(tile_ids) == 1 else UNCOLLAPSED
+
+    def fill(self, words: np.ndarray, region: Tuple[slice, ...] = ()):
+        self.words[region] = words
+        tile_ids = bitset.unpack(words)
+        self.collapsed[region] = tile_ids[0] if len(tile_ids) == 1 else UNCOLLAPSED
+
+    # words and tile ids of the cells lo <= pos < hi
+    def block(self, lo: Pos, hi: Pos) -> Tuple[np.ndarray, np.ndarray]:
+        region = tuple(slice(l, h) for l, h in zip(lo, hi))
+        return self.words[region], self.collapsed[region]
+
+    def flush(self):
+        if self.is_memmap:
+            self.words.flush()
+            self.collapsed.flush()
+
+
+# DomainArray split into chunks that are only allocated once they stop being uniform
+# a uniform chunk is stored as the single domain all its cells share, so memory follows the cells that differ from
+# their surroundings rather than the bounding box
+class SparseDomainArray:
+    def __init__(self, shape: Tuple[int, ...], n_tiles: int, chunk_shape: Tuple[int, ...]):
+        self.shape = shape
+        self.n_tiles = n_tiles
+        self.n_words = bitset.n_words(n_tiles)
+        self.chunk_shape = chunk_shape
+        self.grid_shape = tuple(-(-n // c) for n, c in zip(shape, chunk_shape))
+        self.uniform = np.zeros(self.grid_shape + (self.n_words,), dtype=bitset.WORD_DTYPE)
+        self.uniform_collapsed = np.full(self.grid_shape, UNCOLLAPSED, dtype=np.int16)
+        self.chunks: Dict[Pos, DomainArray] = {}
+
+    @property
+    def n_allocated(self) -> int:
+        return len(self.chunks)
+
+    def _split(self, pos: Pos) -> Tuple[Pos, Pos]:
+        return tuple(p // c for p, c in zip(pos, self.chunk_shape)), tuple(p % c for p, c in zip(pos, self.chunk_shape))
+
+    def get(self, pos: Pos) -> np.ndarray:
+        index, local_pos = self._split(pos)
+        chunk = self.chunks.get(index)
+        return self.uniform[index] if chunk is None else chunk.get(local_pos)
+
+    def tile(self, pos: Pos) -> int:
+        index, local_pos = self._split(pos)
+        chunk = self.chunks.get(index)
+        return self.uniform_collapsed[index] if chunk is None else chunk.tile(local_pos)
+
+    def set(self, pos: Pos, words: np.ndarray):
+        index, local_pos = self._split(pos)
+        chunk = self.chunks.get(index)
+        if chunk is None:
+            if np.array_equal(self.uniform[index], words):
+                return
+            chunk = DomainArray(self.chunk_shape, self.n_tiles)
+            chunk.fill(self.uniform[index])
+            self.chunks[index] = chunk
+        chunk.set(local_pos, words)
+
+    def fill(self, words: np.ndarray):
+        self.chunks.clear()
+        self.uniform[...] = words
+        tile_ids = bitset.unpack(words)
+        self.uniform_collapsed[...] = tile_ids[0] if len(tile_ids) == 1 else UNCOLLAPSED
+
+    def compact(self):
+        # releases the chunks that have become uniform again, e.g. all EMPTY once collapsed
+        for index, chunk in list(self.chunks.items()):
+            region = tuple(slice(0, min(c, n - i * c)) for i, c, n in zip(index, self.chunk_shape, self.shape))
+            words = chunk.words[region].reshape(-1, self.n_words)
+            if (words == words[0]).all():
+                self.uniform[index] = words[0]
+                self.uniform_collapsed[index] = chunk.collapsed[region].flat[0]
+                del self.chunks[index]
+
+    # words and tile ids of the cells lo <= pos < hi, assembled from the chunks they overlap
+    def block(self, lo: Pos, hi: Pos) -> Tuple[np.ndarray, np.ndarray]:
+        shape = tuple(h - l for l, h in zip(lo, hi))
+        words = np.empty(shape + (self.n_words,), dtype=bitset.WORD_DTYPE)
+        collapsed = np.empty(shape, dtype=np.int16)
+        for index in itertools.product(*(range(l // c, -(-h // c)) for l, h, c in zip(lo, hi, self.chunk_shape))):
+            bounds = [(max(i * c, l), min((i + 1) * c, h)) for i, c, l, h in zip(index, self.chunk_shape, lo, hi)]
+            out = tuple(slice(a - l, b - l) for (a, b), l in zip(bounds, lo))
+            chunk = self.chunks.get(index)
+            if chunk is None:
+                words[out] = self.uniform[index]
+                collapsed[out] = self.uniform_collapsed[index]
+            else:
+                local = tuple(slice(a - i * c, b - i * c) for (a, b), i, c in zip(bounds, index, self.chunk_shape))
+                words[out] = chunk.words[local]
+                collapsed[out] = chunk.collapsed[local]
+        return words, collapsed
+
+    @property
+    def words(self) -> np.ndarray:
+        return self.block((0,) * len(self.shape), self.shape)[0]
+
+    @property
+    def collapsed(self) -> np.ndarray:
+        return self.block((0,) * len(self.shape), self.shape)[1]
+
+
+# copy-on-write domains: a read-only base shared between forks plus the cells each fork changed since
+# without a base every cell holds the shared default domain, e.g. the full domain of a fresh grid, so nothing is
+# allocated per cell until it is first constrained
+# the changes are folded into a new base once there are more than max_changes of them, which keeps lookups cheap
+# and makes writes amortized O(1); fork only copies the changes
+class CowDomainArray:
+    def __init__(self, shape: Tuple[int, ...], n_tiles: int, default: np.ndarray,
+                 base: Optional[DomainArray] = None, changes: Optional[Dict[Pos, Tuple[np.ndarray, int]]] = None,
+                 max_changes: Optional[int] = None):
+        self.shape = shape
+        self.n_tiles = n_tiles
+        self.n_words = bitset.n_words(n_tiles)
+        self.default = _read_only(default.copy())
+        tile_ids = bitset.unpack(default)
+        self.default_tile = tile_ids[0] if len(tile_ids) == 1 else UNCOLLAPSED
+        self.base = base
+        self.changes: Dict[Pos, Tuple[np.ndarray, int]] = {} if changes is None else changes
+        self.max_changes = max(int(np.prod(shape)) // 4, 64) if max_changes is None else max_changes
+
+    # takes over the arrays of domains, which must not be written to through domains afterwards
+    @classmethod
+    def freeze(cls, domains: DomainArray) -> "CowDomainArray":
+        base = DomainArray(domains.shape, domains.n_tiles, _read_only(domains.words), _read_only(domains.collapsed))
+        return cls(domains.shape, domains.n_tiles, bitset.full(domains.n_tiles), base)
+
+    @property
+    def n_changes(self) -> int:
+        return len(self.changes)
+
+    def get(self, pos: Pos) -> np.ndarray:
+        change = self.changes.get(pos)
+        if change is not None:
+            return change[0]
+        return self.default if self.base is None else self.base.get(pos)
+
+    def tile(self, pos: Pos) -> int:
+        change = self.changes.get(pos)
+        if change is not None:
+            return change[1]
+        return self.default_tile if self.base is None else self.base.tile(pos)
+
+    def set(self, pos: Pos, words: np.ndarray):
+        tile_ids = bitset.unpack(words)
+        self.changes[pos] = (_read_only(words.copy()), tile_ids[0] if len(tile_ids) == 1 else UNCOLLAPSED)
+        if len(self.changes) > self.max_changes:
+            self.materialize()
+
+    def fill(self, words: np.ndarray):
+        self.default = _read_only(words.copy())
+        tile_ids = bitset.unpack(words)
+        self.default_tile = tile_ids[0] if len(tile_ids) == 1 else UNCOLLAPSED
+        self.base = None
+        self.changes = {}
+
+    def fork(self) -> "CowDomainArray":
+        return CowDomainArray(self.shape, self.n_tiles, self.default, self.base, dict(self.changes), self.max_changes)
+
+    def materialize(self):
+        # folds the changes into a new base, leaving the old one to the forks still sharing it
+        if self.base is None:
+            base = DomainArray(self.shape, self.n_tiles)
+            base.fill(self.default)
+        else:
+            base = DomainArray(self.shape, self.n_tiles, self.base.words.copy(), self.base.collapsed.copy())
+        for pos, (words, tile) in self.changes.items():
+            base.words[pos] = words
+            base.collapsed[pos] = tile
+        self.base = DomainArray(self.shape, self.n_tiles, _read_only(base.words), _read_only(base.collapsed))
+        self.changes = {}
+
+    # words and tile ids of the cells lo <= pos < hi, from the base with the changes in the block applied
+    def block(self, lo: Pos, hi: Pos) -> Tuple[np.ndarray, np.ndarray]:
+        shape = tuple(h - l for l, h in zip(lo, hi))
+        if self.base is None:
+            words = np.broadcast_to(self.default, shape + (self.n_words,)).copy()
+            collapsed = np.full(shape, self.default_tile, dtype=np.int16)
+        else:
+            words, collapsed = (block.copy() for block in self.base.block(lo, hi))
+        for pos, (change_words, tile) in self.changes.items():
+            if all(l <= p < h for p, l, h in zip(pos, lo, hi)):
+                index = tuple(p - l for p, l in zip(pos, lo))
+                words[index] = change_words
+                collapsed[index] = tile
+        return words, collapsed
+
+    @property
+    def words(self) -> np.ndarray:
+        return self.block((0,) * len(self.shape), self.shape)[0]
+
+    @property
+    def collapsed(self) -> np.ndarray:
+        return self.block((0,) * len(self.shape), self.shape)[1]
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
@@ -0,0 +1,81 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+
+from grid.cow_array import CowArray
+from grid.pos import Pos
+from tiles import bitset
+
+
+class EntropyHeuristic(ABC):
+    def __init__(self, grid: "Grid"):
+        self.grid = grid
+
+    @abstractmethod
+    def entropy(self, pos: Pos) -> float:
+        pass
+
+    def update(self, pos: Pos, old_words: np.ndarray, new_words: np.ndarray):
+        pass
+
+    # heuristic of grid, a fork of this one's grid (see GridArray.fork), that shares this one's state copy-on-write
+    def fork(self, grid: "Grid") -> "EntropyHeuristic":
+        return type(self)(grid)
+
+
+class CountEntropy(EntropyHeuristic):
+
+    def entropy(self, pos: Pos) -> float:
+        n = bitset.count(self.grid.get_domain(pos))
+        return 0 if n == 1 else n
+
+
+# weighted Shannon entropy H = log(sum w) - sum(w log w) / sum w
+# the two sums are cached per cell and updated from the tiles a domain change adds or removes
+class ShannonEntropy(EntropyHeuristic):
+    def __init__(self, grid: "Grid"):
+        super().__init__(grid)
+        weights = grid.compiled.weights
+        self.weights = weights
+        self.weight_log_weights = np.where(weights > 0, weights * np.log(np.where(weights > 0, weights, 1)), 0)
+        self.sum_weights: Optional[CowArray] = None
+        self.sum_weight_log_weights: Optional[CowArray] = None
+
+    def _index(self, pos: Pos) -> Pos:
+        return tuple(p - bounds[0] for p, bounds in zip(pos, self.grid.index_bounds))
+
+    def _initialize(self):
+        domains = np.array([
+            bitset.to_bool(self.grid.get_domain(pos), self.grid.n_tiles) for pos in self.grid.pos_iterator
+        ]).reshape(self.grid.shape + (self.grid.n_tiles,))
+        self.sum_weights = CowArray(domains @ self.weights)
+        self.sum_weight_log_weights = CowArray(domains @ self.weight_log_weights)
+
+    def fork(self, grid: "Grid") -> "ShannonEntropy":
+        heuristic = super().fork(grid)
+        if self.sum_weights is not None:
+            heuristic.sum_weights = self.sum_weights.fork()
+            heuristic.sum_weight_log_weights = self.sum_weight_log_weights.fork()
+        return heuristic
+
+    def update(self, pos: Pos, old_words: np.ndarray, new_words: np.ndarray):
+        if self.sum_weights is None:
+            return
+        idx = self._index(pos)
+        removed = bitset.unpack(old_words & ~new_words)
+        added = bitset.unpack(new_words & ~old_words)
+        self.sum_weights[idx] += self.weights[added].sum() - self.weights[removed].sum()
+        self.sum_weight_log_weights[idx] += \
+            self.weight_log_weights[added].sum() - self.weight_log_weights[removed].sum()
+
+    def entropy(self, pos: Pos) -> float:
+        if self.grid.is_collapsed(pos):
+            return 0
+        if self.sum_weights is None:
+            self._initialize()
+        idx = self._index(pos)
+        sum_weights = self.sum_weights[idx]
+        if sum_weights <= 0:
+            return 0
+        return np.log(sum_weights) - self.sum_weight_log_weights[idx] / sum_weights
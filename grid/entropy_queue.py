@@ -0,0 +1,112 @@
+import heapq
+from typing import List, Tuple, Callable, Optional
+
+import numpy as np
+
+from grid.pos import Pos
+
+Entry = Tuple[float, float, Pos]
+
+
+# min-heap of (entropy, tie-break noise, pos)
+# entries are never updated in place: a cell whose entropy changes is pushed again, and entries that no longer
+# match the cell's current entropy are dropped when they reach the top
+# fork freezes the heap and shares it with the fork; each queue then walks the frozen heaps without changing them,
+# keeping a small heap of the indices of their entries it has not popped yet (the children of the popped ones)
+class EntropyQueue:
+    # frozen heaps are merged back into one once a chain of forks has left this many of them
+    MAX_FROZEN = 8
+
+    def __init__(self, entropy: Callable[[Pos], float], is_collapsed: Callable[[Pos], bool],
+                 rng: np.random.Generator):
+        self.entropy = entropy
+        self.is_collapsed = is_collapsed
+        self.rng = rng
+        self.heap: List[Entry] = []
+        self.frozen: List[Tuple[List[Entry], List[Tuple[Entry, int]]]] = []
+        self.n_dropped: List[int] = []
+
+    def __len__(self):
+        return len(self.heap) + sum(len(heap) for heap, _ in self.frozen) - sum(self.n_dropped)
+
+    def push(self, pos: Pos):
+        if not self.is_collapsed(pos):
+            heapq.heappush(self.heap, (self.entropy(pos), self.rng.random(), pos))
+
+    def extend(self, positions):
+        for pos in positions:
+            if not self.is_collapsed(pos):
+                self.heap.append((self.entropy(pos), self.rng.random(), pos))
+        heapq.heapify(self.heap)
+
+    def fork(self, entropy: Callable[[Pos], float], is_collapsed: Callable[[Pos], bool],
+             rng: np.random.Generator) -> "EntropyQueue":
+        if len(self.frozen) >= self.MAX_FROZEN:
+            self._merge()
+        if len(self.heap) > 0:
+            self.frozen.append((self.heap, [(self.heap[0], 0)]))
+            self.n_dropped.append(0)
+            self.heap = []
+        queue = EntropyQueue(entropy, is_collapsed, rng)
+        queue.frozen = [(heap, list(frontier)) for heap, frontier in self.frozen]
+        queue.n_dropped = list(self.n_dropped)
+        return queue
+
+    def _merge(self):
+        entries = self.heap
+        for heap, frontier in self.frozen:
+            stack = [k for _, k in frontier]
+            while len(stack) > 0:
+                k = stack.pop()
+                entries.append(heap[k])
+                stack.extend(c for c in (2 * k + 1, 2 * k + 2) if c < len(heap))
+        heapq.heapify(entries)
+        self.heap, self.frozen, self.n_dropped = entries, [], []
+
+    def _top(self) -> Tuple[Optional[Entry], int]:
+        # smallest entry and where it is: -1 for the heap, otherwise the index of the frozen heap
+        top, source = (self.heap[0], -1) if len(self.heap) > 0 else (None, -1)
+        for level, (_, frontier) in enumerate(self.frozen):
+            if len(frontier) > 0 and (top is None or frontier[0][0] < top):
+                top, source = frontier[0][0], level
+        return top, source
+
+    def _drop(self, source: int):
+        if source < 0:
+            heapq.heappop(self.heap)
+            return
+        heap, frontier = self.frozen[source]
+        _, k = heapq.heappop(frontier)
+        self.n_dropped[source] += 1
+        for c in (2 * k + 1, 2 * k + 2):
+            if c < len(heap):
+                heapq.heappush(frontier, (heap[c], c))
+
+    def peek(self) -> Optional[Tuple[Pos, float]]:
+        while True:
+            top, source = self._top()
+            if top is None:
+                return None
+            entropy, _, pos = top
+            if not self.is_collapsed(pos) and self.entropy(pos) == entropy:
+                return pos, entropy
+            self._drop(source)
+
+    def pop(self) -> Optional[Pos]:
+        entry = self.pop_entry()
+        return None if entry is None else entry[2]
+
+    def pop_entry(self) -> Optional[Entry]:
+        while True:
+            top, source = self._top()
+            if top is None:
+                return None
+            self._drop(source)
+            entropy, _, pos = top
+            if not self.is_collapsed(pos) and self.entropy(pos) == entropy:
+                return top
+
+    # puts back entries taken off by pop_entry, which keep their place as the cells have not changed since
+    def restore(self, entries: List[Entry]):
+        for entry in entries:
+            heapq.heappush(self.heap, entry)
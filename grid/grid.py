@@ -1,43 +1,161 @@
 import itertools
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Iterable
+from typing import Dict, Optional, Iterable, Callable, Tuple, List, Union, Set
 
-from grid.cell import UncollapsedCell, Cell
+import numpy as np
+
+from grid.cell import UncollapsedCell, Cell, CollapsedCell
+from grid.contradiction import Contradiction, PinContradiction
+from grid.domain import DomainArray, UNCOLLAPSED
 from directions import Directions
-from grid.grid_boundary import GridBoundary
+from grid.entropy import EntropyHeuristic, CountEntropy
+from grid.entropy_queue import EntropyQueue
+from grid.grid_boundary import GridBoundary, PeriodicGridBoundary, ConstantGridBoundary
+from grid.initial_state import InitialStateCache
+from grid.trail import Trail
 from grid.pos import Pos
 from propagator import Propagator
+from tiles import bitset
+from tiles.compiled import CompiledTileSet
 from tiles.data import TileData
 from tiles.names import TileNames
 
 
 class Grid(ABC):
-    def __init__(self, index_bounds, boundary: GridBoundary, tile_data: Dict[TileNames, TileData],
-                 init_cell_factory=None):
+    NO_NEIGHBOR = -1
+
+    # tile_data may be None when a compiled tileset is given, in which case the Cell views are unavailable
+    # with initial_states the grid starts out with the boundary propagated through, as after propagate_boundary,
+    # copied from the cache if an identical grid was built before
+    def __init__(self, index_bounds, boundary: GridBoundary, tile_data: Optional[Dict[TileNames, TileData]],
+                 init_cell_factory=None, propagator_factory: Callable[["Grid"], Propagator] = Propagator,
+                 entropy_factory: Callable[["Grid"], EntropyHeuristic] = CountEntropy,
+                 rng: Optional[np.random.Generator] = None, compiled: Optional[CompiledTileSet] = None,
+                 initial_states: Optional[InitialStateCache] = None):
         self.index_bounds = index_bounds
+        self.flat_strides = tuple(int(np.prod(self.shape[ax + 1:])) for ax in range(self.dim))
+        # (lower bound, stride, size) per axis, to go from flat indices to positions and neighbors
+        self.flat_axes = tuple((lo, stride, hi - lo) for (lo, hi), stride in zip(index_bounds, self.flat_strides))
+        self.rng = np.random.default_rng() if rng is None else rng
         self.boundary = boundary
         self.tile_data = tile_data
-        if init_cell_factory is None:
-            init_cell_factory = lambda: UncollapsedCell(self.tile_data, {*self.tile_data.keys()})
-        self.populate_grid(init_cell_factory)
-        self.constrain_boundary()
+        if tile_data is not None:
+            self.tile_names = [data.name for data in sorted(tile_data.values(), key=lambda data: data.tile_id)]
+        self.compiled = CompiledTileSet.from_tile_data(tile_data) if compiled is None else compiled
+        # (axis, step, flat offset) of every direction in compiled order
+        self.direction_steps = [self._direction_step(direction) for direction in self.compiled.directions]
+        self.neighbor_buffer = [self.NO_NEIGHBOR] * len(self.direction_steps)
+        self.propagator_factory = propagator_factory
+        self.entropy_factory = entropy_factory
+        self.entropy_heuristic = entropy_factory(self)
+        self.entropy_queue: Optional[EntropyQueue] = None
+        self.trail: Optional[Trail] = None
+        # cells written since the set was last taken, collected while it is not None, see take_dirty
+        self.dirty: Optional[Set[Pos]] = None
+        words = bitset.full(self.n_tiles) if init_cell_factory is None else self.cell_to_domain(init_cell_factory())
+        self.populate_grid(words)
+        self.propagator = propagator_factory(self)
+        if initial_states is None:
+            self.constrain_boundary()
+        else:
+            initial_states.initialize(self, words)
 
     @property
     def dim(self):
         return len(self.index_bounds)
 
+    @property
+    def n_tiles(self) -> int:
+        return self.compiled.n_tiles
+
     @abstractmethod
-    def populate_grid(self, init_cell_factory):
+    def populate_grid(self, words: np.ndarray):
         pass
 
+    # replaces every domain with the ones in domains, which are shared and must not be written to
+    def load_domains(self, domains: DomainArray):
+        for pos in self.pos_iterator:
+            self.write_domain(pos, domains.get(tuple(p - bounds[0] for p, bounds in zip(pos, self.index_bounds))))
+
     @abstractmethod
-    def get_cell(self, pos: Pos) -> Cell:
+    def get_domain(self, pos: Pos) -> np.ndarray:
         pass
 
     @abstractmethod
-    def set_cell(self, pos: Pos, cell: Cell):
+    def write_domain(self, pos: Pos, words: np.ndarray):
         pass
 
+    def get_domain_at(self, i: int) -> np.ndarray:
+        return self.get_domain(self.position(i))
+
+    def set_domain_at(self, i: int, words: np.ndarray):
+        self.set_domain(self.position(i), words)
+
+    # every domain write goes through here, which keeps the trail, entropy heuristic, entropy queue and dirty cells
+    # in step with the domains
+    def set_domain(self, pos: Pos, words: np.ndarray):
+        old_words = self.get_domain(pos)
+        if self.trail is not None:
+            self.trail.record(pos, old_words)
+        self.entropy_heuristic.update(pos, old_words, words)
+        self.write_domain(pos, words)
+        if self.entropy_queue is not None:
+            self.entropy_queue.push(pos)
+        if self.dirty is not None:
+            self.dirty.add(pos)
+
+    def take_dirty(self) -> Set[Pos]:
+        # the cells changed since the last call, e.g. by a collapse and its propagation, and starts collecting them
+        dirty, self.dirty = self.dirty, set()
+        return set() if dirty is None else dirty
+
+    def get_cell(self, pos: Pos) -> Cell:
+        if self.in_bounds(pos):
+            return self.domain_to_cell(self.get_domain(pos))
+        else:
+            return self.boundary.get_cell(self, pos)
+
+    def set_cell(self, pos: Pos, cell: Cell):
+        self.set_domain(pos, self.cell_to_domain(cell))
+
+    def cell_to_domain(self, cell: Cell) -> np.ndarray:
+        return bitset.pack((self.tile_data[t].tile_id for t in cell.tiles), self.n_tiles)
+
+    def domain_to_cell(self, words: np.ndarray) -> Cell:
+        tile_ids = bitset.unpack(words)
+        if len(tile_ids) == 1:
+            return CollapsedCell(self.tile_data, self.tile_names[tile_ids[0]])
+        return UncollapsedCell(self.tile_data, {self.tile_names[i] for i in tile_ids})
+
+    def get_compatible_domain(self, words: np.ndarray, direction: Directions) -> np.ndarray:
+        return self.compiled.compatible_domain(words, self.compiled.direction_index[direction])
+
+    # a domain left with only tiles of weight 0 cannot be collapsed, which is a contradiction at pos like any other
+    def collapse_domain(self, words: np.ndarray, pos: Optional[Pos] = None) -> np.ndarray:
+        tile_ids = bitset.unpack(words)
+        weights = self.compiled.weights[tile_ids]
+        total = weights.sum()
+        if total <= 0:
+            raise Contradiction(pos)
+        return bitset.pack([self.rng.choice(tile_ids, p=weights / total)], self.n_tiles)
+
+    def collapse_domains(self, domains: np.ndarray, positions: Optional[List[Pos]] = None) -> np.ndarray:
+        # one weighted draw for a whole (k, n_words) batch of domains, by inverse transform sampling
+        weights = bitset.to_bool(domains, self.n_tiles) * self.compiled.weights
+        cdf = np.cumsum(weights, axis=1)
+        stuck = np.flatnonzero(cdf[:, -1] <= 0)
+        if len(stuck) > 0:
+            raise Contradiction(None if positions is None else positions[stuck[0]])
+        u = self.rng.random(len(domains)) * cdf[:, -1]
+        tile_ids = np.minimum((cdf <= u[:, None]).sum(axis=1), self.n_tiles - 1)
+        return bitset.from_bool(np.arange(self.n_tiles) == tile_ids[:, None])
+
+    def entropy(self, pos: Pos) -> float:
+        return self.entropy_heuristic.entropy(pos)
+
+    def is_collapsed(self, pos: Pos) -> bool:
+        return bitset.count(self.get_domain(pos)) <= 1
+
     # todo generalize to d dim
     def constrain_boundary(self):
         for pos in itertools.chain(*(
@@ -47,17 +165,113 @@ class Grid(ABC):
                                 else self.axis_iterator(ax))
                         for ax in range(self.dim)
                 )) for chained_ax in range(self.dim))):
-            Propagator(self).constrain(pos)
+            self.propagator.constrain(pos)
+
+    # constrain_boundary only narrows the cells along the border, this carries that through the whole grid
+    def propagate_boundary(self):
+        self.propagator.propagate_from_all(
+            pos for pos in self.pos_iterator
+            if any(x in (lo, hi - 1) for x, (lo, hi) in zip(pos, self.index_bounds))
+        )
+
+    # restricts many cells at once and propagates them together in a single pass
+    # a pin is a tile id, a tile name, a bitset domain or a boolean mask over the tiles; the cell keeps the tiles it
+    # allows that it still has
+    # if the pins contradict the grid it is left as it was and a PinContradiction names a smallest conflicting subset
+    # of them, found by re-propagating subsets (skipped without explain, which then names all of them)
+    def pin(self, pins: Dict[Pos, Union[int, TileNames, np.ndarray]], explain: bool = True):
+        domains = {}
+        for pos, value in pins.items():
+            if not self.in_bounds(pos):
+                raise ValueError(f"Cannot pin cell {pos}")
+            domains[pos] = self.pin_domain(value)
+        error = self._apply_pins(domains, keep=True)
+        if error is not None:
+            raise PinContradiction(self._conflicting_pins(domains) if explain else list(domains), error.pos) \
+                from error
+
+    # pins given as an array over the grid: (*shape) tile ids, UNCOLLAPSED where a cell is not pinned, or
+    # (*shape, n_tiles) boolean masks of the allowed tiles
+    def pin_array(self, tiles: np.ndarray, explain: bool = True):
+        lower = [bounds[0] for bounds in self.index_bounds]
+        if tiles.shape == self.shape:
+            pins = {tuple(int(i) + l for i, l in zip(index, lower)): int(tiles[index])
+                    for index in zip(*np.nonzero(tiles != UNCOLLAPSED))}
+        else:
+            pins = {tuple(int(i) + l for i, l in zip(index, lower)): tiles[index]
+                    for index in zip(*np.nonzero(~tiles.all(axis=-1)))}
+        self.pin(pins, explain)
+
+    def pin_domain(self, value: Union[int, TileNames, np.ndarray]) -> np.ndarray:
+        if isinstance(value, (int, np.integer)):
+            return bitset.pack([int(value)], self.n_tiles)
+        if isinstance(value, np.ndarray):
+            return bitset.from_bool(value) if value.dtype == bool else value
+        return bitset.pack([self.tile_data[value].tile_id], self.n_tiles)
+
+    def _apply_pins(self, domains: Dict[Pos, np.ndarray], keep: bool) -> Optional[Contradiction]:
+        # applies and propagates the pins, undoing everything again on a contradiction or unless keep is set
+        if len(domains) == 0:
+            return None
+        self.trail = Trail()
+        self.trail.checkpoint(next(iter(domains)), UNCOLLAPSED)
+        try:
+            changed = []
+            for pos, words in domains.items():
+                old_words = self.get_domain(pos)
+                new_words = old_words & words
+                if not new_words.any():
+                    raise Contradiction(pos)
+                if (new_words != old_words).any():
+                    self.set_domain(pos, new_words)
+                    changed.append(pos)
+            self.propagator.propagate_from_all(changed)
+        except Contradiction as error:
+            self.rollback()
+            return error
+        else:
+            if not keep:
+                self.rollback()
+            return None
+        finally:
+            self.trail = None
+
+    def _conflicting_pins(self, domains: Dict[Pos, np.ndarray]) -> List[Pos]:
+        def fails(positions: List[Pos]) -> bool:
+            return self._apply_pins({pos: domains[pos] for pos in positions}, keep=False) is not None
+
+        # every trial is undone, so they can run on a plain Propagator, which reaches the same fixpoint without
+        # any state to keep in sync
+        propagator, self.propagator = self.propagator, Propagator(self)
+        try:
+            # the shortest failing prefix, by bisection; its last pin is needed, as the prefix without it succeeds
+            positions = list(domains)
+            lo, hi = 1, len(positions)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if fails(positions[:mid]):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            conflict = positions[:lo]
+            # then drop every other pin the contradiction does not need
+            i = 0
+            while i < len(conflict) - 1:
+                if fails(conflict[:i] + conflict[i + 1:]):
+                    conflict = conflict[:i] + conflict[i + 1:]
+                else:
+                    i += 1
+            return conflict
+        finally:
+            self.propagator = propagator
 
     def local_collapse(self, pos):
-        self.set_cell(self.get_cell(pos).collapse())
-        for direction, npos in self.get_neighbor_dict(pos):
-            compatible_tiles = self.get_cell(pos).get_compatible_tiles(direction)
-            self.get_cell(npos).constrain(compatible_tiles)
+        self.set_domain(pos, self.collapse_domain(self.get_domain(pos), pos))
+        self.propagator.constrain(pos)
 
     def propagated_collapse(self, pos):
-        self.set_cell(pos, self.get_cell(pos).collapse())
-        Propagator(self).propagate_from(pos)
+        self.set_domain(pos, self.collapse_domain(self.get_domain(pos), pos))
+        self.propagator.propagate_from(pos)
 
     def collapse(self, pos):
         return self.propagated_collapse(pos)
@@ -70,6 +284,111 @@ class Grid(ABC):
         for pos in self.pos_iterator:
             self.collapse(pos)
 
+    # collapses up to batch_size low entropy cells with disjoint neighborhoods per step and propagates them in one
+    # pass; a batch that runs into a contradiction is rolled back and redone one cell at a time
+    def batch_collapse(self, batch_size: int = 64, max_scan: Optional[int] = None):
+        max_scan = 4 * batch_size if max_scan is None else max_scan
+        self.min_entropy_pos()
+        while True:
+            batch = self.independent_min_entropy_positions(batch_size, max_scan)
+            if len(batch) == 0:
+                return
+            words = self.collapse_domains(np.array([self.get_domain(pos) for pos in batch]), batch)
+            self.trail = Trail()
+            self.trail.checkpoint(batch[0], bitset.unpack(words[0])[0])
+            try:
+                for pos, pos_words in zip(batch, words):
+                    self.set_domain(pos, pos_words)
+                self.propagator.propagate_from_all(batch)
+                conflict = False
+            except Contradiction:
+                self.rollback()
+                conflict = True
+            finally:
+                self.trail = None
+            if conflict:
+                for pos in batch:
+                    if not self.is_collapsed(pos):
+                        self.collapse(pos)
+
+    # low entropy cells with disjoint neighborhoods, popped from the entropy queue in order; the cells passed over
+    # are put back as they were
+    def independent_min_entropy_positions(self, batch_size: int, max_scan: int) -> List[Pos]:
+        batch, rejected, claimed = [], [], set()
+        while len(batch) < batch_size and len(batch) + len(rejected) < max_scan:
+            entry = self.entropy_queue.pop_entry()
+            if entry is None:
+                break
+            i = self.flat_index(entry[2])
+            neighborhood = {i, *self.neighbor_indices(i)}
+            neighborhood.discard(self.NO_NEIGHBOR)
+            if claimed.isdisjoint(neighborhood):
+                batch.append(entry[2])
+                claimed |= neighborhood
+            else:
+                rejected.append(entry)
+        self.entropy_queue.restore(rejected)
+        return batch
+
+    def backtracking_collapse(self, max_backtracks: int = 1000, min_entropy: bool = True) -> int:
+        n_cells = int(np.prod(self.shape))
+        cursor = 0
+
+        def next_pos() -> Optional[Pos]:
+            nonlocal cursor
+            if min_entropy:
+                return next(self.min_entropy_pos_iterator, None)
+            while cursor < n_cells and self.is_collapsed(self.position(cursor)):
+                cursor += 1
+            return self.position(cursor) if cursor < n_cells else None
+
+        self.trail = Trail()
+        backtracks = 0
+        try:
+            pos = next_pos()
+            while pos is not None:
+                try:
+                    # a cell left with tiles of weight 0 only fails before its decision is made, so the last
+                    # decision is undone instead
+                    words = self.collapse_domain(self.get_domain(pos), pos)
+                    self.trail.checkpoint(pos, bitset.unpack(words)[0])
+                    self.set_domain(pos, words)
+                    self.propagator.propagate_from(pos)
+                except Contradiction:
+                    # undo decisions until banning the chosen tile leaves a consistent grid
+                    while True:
+                        backtracks += 1
+                        if backtracks > max_backtracks or self.trail.depth == 0:
+                            raise
+                        pos, tile = self.rollback()
+                        cursor = min(cursor, self.flat_index(pos))
+                        banned = self.get_domain(pos).copy()
+                        banned[tile // bitset.WORD_BITS] &= ~np.uint64(1 << (tile % bitset.WORD_BITS))
+                        if not banned.any():
+                            continue
+                        try:
+                            self.set_domain(pos, banned)
+                            self.propagator.propagate_from(pos)
+                            break
+                        except Contradiction:
+                            continue
+                pos = next_pos()
+        finally:
+            self.trail = None
+        return backtracks
+
+    def rollback(self) -> Tuple[Pos, int]:
+        trail, self.trail = self.trail, None
+        undone, pos, tile = trail.pop_checkpoint()
+        restored = set()
+        for npos, words in undone:
+            self.set_domain(npos, words)
+            restored.add(npos)
+        for npos in restored:
+            self.propagator.sync(npos)
+        self.trail = trail
+        return pos, tile
+
     def axis_iterator(self, axis: int):
         return range(*self.index_bounds[axis])
 
@@ -93,6 +412,63 @@ class Grid(ABC):
         else:
             return self.boundary.map_pos(self, delta_pos)
 
+    # cells are also addressed by their flat index in pos_iterator order; nothing is stored per cell for that, so
+    # propagators work on flat indices without costing more memory than the domains themselves
+    def position(self, i: int) -> Pos:
+        return tuple(lo + i // stride % n for lo, stride, n in self.flat_axes)
+
+    def flat_index(self, pos: Pos) -> int:
+        return sum((p - lo) * stride for p, (lo, stride, n) in zip(pos, self.flat_axes))
+
+    def _direction_step(self, direction: Directions) -> Tuple[int, int, int]:
+        axes = np.flatnonzero(direction.value)
+        if len(axes) != 1 or abs(direction.value[axes[0]]) != 1:
+            raise ValueError(f"Direction {direction.value} is not a unit step along one axis")
+        axis = int(axes[0])
+        step = direction.value[axis]
+        return axis, step, step * self.flat_strides[axis]
+
+    # flat indices of the neighbors of cell i in compiled direction order, NO_NEIGHBOR where the boundary has none
+    # the same list is filled on every call, so it is only valid until the next one
+    def neighbor_indices(self, i: int) -> List[int]:
+        neighbors = self.neighbor_buffer
+        for k, (axis, step, offset) in enumerate(self.direction_steps):
+            lo, stride, n = self.flat_axes[axis]
+            if 0 <= i // stride % n + step < n:
+                neighbors[k] = i + offset
+            else:
+                neighbors[k] = self._boundary_neighbor(i, k)
+        return neighbors
+
+    # (len(cells), D) flat indices of the neighbors of an array of cells, as neighbor_indices
+    def neighbor_index_array(self, cells: np.ndarray) -> np.ndarray:
+        table = np.empty((len(cells), len(self.direction_steps)), dtype=np.int32)
+        for k, (axis, step, offset) in enumerate(self.direction_steps):
+            lo, stride, n = self.flat_axes[axis]
+            coords = cells // stride % n + step
+            outside = (coords < 0) | (coords >= n)
+            table[:, k] = cells + offset
+            if isinstance(self.boundary, PeriodicGridBoundary):
+                table[outside, k] -= step * stride * n
+            elif isinstance(self.boundary, ConstantGridBoundary):
+                table[outside, k] = self.NO_NEIGHBOR
+            else:
+                for i in np.flatnonzero(outside):
+                    table[i, k] = self._boundary_neighbor(int(cells[i]), k)
+        return table
+
+    def _boundary_neighbor(self, i: int, k: int) -> int:
+        # neighbor of cell i across the edge in direction k
+        axis, step, offset = self.direction_steps[k]
+        if isinstance(self.boundary, PeriodicGridBoundary):
+            return i + offset - step * self.flat_axes[axis][1] * self.flat_axes[axis][2]
+        if isinstance(self.boundary, ConstantGridBoundary):
+            return self.NO_NEIGHBOR
+        pos = list(self.position(i))
+        pos[axis] += step
+        npos = self.boundary.map_pos(self, tuple(pos))
+        return self.NO_NEIGHBOR if npos is None else self.flat_index(npos)
+
     def get_neighbor_dict(self, pos: Pos) -> Dict[Directions, Pos]:
         return {
             d: n_pos
@@ -105,21 +481,23 @@ class Grid(ABC):
         return all(self.index_bounds[ax][0] <= x < self.index_bounds[ax][1] for ax, x in enumerate(pos))
 
     def min_entropy_pos(self):
-        pos, min_entropy = min(
-            ((pos, entropy)
-             for pos, entropy in ((pos, self.get_cell(pos).entropy()) for pos in self.pos_iterator)
-             if entropy > 0),
-            key=lambda tup: tup[1], default=(tuple(0 for _ in range(self.dim)), 0))
-        return pos, min_entropy
+        if self.entropy_queue is None:
+            self.entropy_queue = EntropyQueue(self.entropy, self.is_collapsed, self.rng)
+            self.entropy_queue.extend(self.pos_iterator)
+        top = self.entropy_queue.peek()
+        if top is None:
+            return tuple(0 for _ in range(self.dim)), 0
+        return top
 
     @property
     def min_entropy_pos_iterator(self):
         def min_pos_gen():
+            self.min_entropy_pos()
             while True:
-                pos, min_entropy = self.min_entropy_pos()
-                if min_entropy == 0:
+                top = self.entropy_queue.peek()
+                if top is None:
                     break
-                yield pos
+                yield top[0]
 
         return iter(min_pos_gen())
 
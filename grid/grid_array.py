@@ -1,41 +1,128 @@
-from typing import Tuple, Iterable
+import copy
+from typing import Tuple, Iterable, Callable, Optional
 
 import numpy as np
 
 from directions import Directions, DIRECTIONS_DIM_MAP
-from grid.cell import Cell
+from grid.domain import DomainArray, CowDomainArray, UNCOLLAPSED
+from grid.entropy import EntropyHeuristic, CountEntropy
 from grid.grid import Grid
 from grid.grid_boundary import GridBoundary
+from grid.initial_state import InitialStateCache
 from grid.pos import Pos
+from propagator import Propagator
+from tiles.compiled import CompiledTileSet
+from tiles.image import write_image
 
 
 class GridArray(Grid):
+    # flat (N, n_words) view of the words of a dense DomainArray, for reads by flat index, and the domains it is of
+    _flat_domains = None
+    _flat_words: Optional[np.ndarray] = None
 
-    def __init__(self, shape: Tuple[int, ...], boundary: GridBoundary, tile_data, init_cell_factory=None):
-        super().__init__(tuple((0, s) for s in shape), boundary, tile_data, init_cell_factory)
-        self.cells: np.ndarray
+    def __init__(self, shape: Tuple[int, ...], boundary: GridBoundary, tile_data, init_cell_factory=None,
+                 propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                 entropy_factory: Callable[[Grid], EntropyHeuristic] = CountEntropy,
+                 rng: Optional[np.random.Generator] = None, compiled: Optional[CompiledTileSet] = None,
+                 initial_states: Optional[InitialStateCache] = None):
+        super().__init__(tuple((0, s) for s in shape), boundary, tile_data, init_cell_factory, propagator_factory,
+                         entropy_factory, rng, compiled, initial_states)
+        self.domains: DomainArray
 
     @property
     def directions(self) -> Iterable[Directions]:
         return DIRECTIONS_DIM_MAP[self.dim]
 
-    def populate_grid(self, init_cell_factory):
-        self.cells = np.array([init_cell_factory() for _ in self.pos_iterator]).reshape(self.shape)
+    def populate_grid(self, words: np.ndarray):
+        self.domains = DomainArray(self.shape, self.n_tiles)
+        self.domains.fill(words)
 
-    def get_cell(self, pos: Pos) -> Cell:
+    def load_domains(self, domains: DomainArray):
+        self.domains.words[...] = domains.words
+        self.domains.collapsed[...] = domains.collapsed
+
+    # cells built from the domains on every call and read-only, as writing to them would not reach the grid; cells
+    # are set through set_cell or pin
+    @property
+    def cells(self) -> np.ndarray:
+        cells = np.empty(self.shape, dtype=object)
+        for pos in self.pos_iterator:
+            cells[pos] = self.get_cell(pos)
+        cells.setflags(write=False)
+        return cells
+
+    @property
+    def collapsed(self) -> np.ndarray:
+        return self.domains.collapsed
+
+    def is_collapsed(self, pos: Pos) -> bool:
         if self.in_bounds(pos):
-            return self.cells[pos]
+            return self.domains.tile(pos) != UNCOLLAPSED or not self.domains.get(pos).any()
+        return super().is_collapsed(pos)
+
+    def get_domain(self, pos: Pos) -> np.ndarray:
+        if self.in_bounds(pos):
+            return self.domains.get(pos)
         else:
-            return self.boundary.get_cell(self, pos)
+            return self.boundary.get_domain(self, pos)
+
+    def get_domain_at(self, i: int) -> np.ndarray:
+        if self.domains is not self._flat_domains:
+            self._flat_domains = self.domains
+            words = self.domains.words if isinstance(self.domains, DomainArray) else None
+            self._flat_words = words.reshape(-1, words.shape[-1]) \
+                if words is not None and words.flags.c_contiguous else None
+        if self._flat_words is None:
+            return self.domains.get(self.position(i))
+        return self._flat_words[i]
 
-    def set_cell(self, pos: Pos, cell: Cell):
+    def write_domain(self, pos: Pos, words: np.ndarray):
         if self.in_bounds(pos):
-            self.cells[pos] = cell
+            self.domains.set(pos, words)
         else:
             raise ValueError(f"Cannot set cell {pos}")
 
+    # a grid with the same domains that can be collapsed independently, e.g. for lookahead or several seeds from a
+    # common prefix; the domains, the propagator's and entropy heuristic's per-cell state and the entropy queue are
+    # shared copy-on-write, so a fork costs as much as the changes it and its parent make afterwards and neither grid
+    # sees the other's writes
+    # the fork continues the random stream of this grid unless rng is given
+    def fork(self, rng: Optional[np.random.Generator] = None) -> "GridArray":
+        if isinstance(self.domains, DomainArray) and not self.domains.is_memmap:
+            self.domains = CowDomainArray.freeze(self.domains)
+        elif not isinstance(self.domains, CowDomainArray):
+            raise TypeError(f"Cannot fork a grid with {type(self.domains).__name__} domains")
+        if self.trail is not None:
+            raise RuntimeError("Cannot fork a grid while it is backtracking")
+        grid = copy.copy(self)
+        grid.domains = self.domains.fork()
+        grid.rng = copy.deepcopy(self.rng) if rng is None else rng
+        grid.dirty = None
+        grid.neighbor_buffer = list(self.neighbor_buffer)
+        grid.entropy_heuristic = self.entropy_heuristic.fork(grid)
+        grid.propagator = self.propagator.fork(grid)
+        if self.entropy_queue is not None:
+            grid.entropy_queue = self.entropy_queue.fork(grid.entropy, grid.is_collapsed, grid.rng)
+        return grid
+
+    # writes the image of a 2d grid with a pixel atlas to a .png or .npy file band by band, reading band_rows rows of
+    # cells at a time through the domain store, see tiles.image
+    def write_image(self, path: str, band_rows: int = 8):
+        if self.compiled.atlas is None or self.dim != 2:
+            raise ValueError("Only 2d grids of a tileset with a pixel atlas can be written as images")
+        write_image(path, self.compiled, self.shape, self.read_band, band_rows)
+
+    def read_band(self, lo: int, hi: int) -> Tuple[np.ndarray, np.ndarray]:
+        words, tile_ids = self.domains.block((lo,) + (0,) * (self.dim - 1), (hi,) + self.shape[1:])
+        return tile_ids, words
+
+    # with a pixel atlas the image is gathered from it in one go, otherwise it is assembled from the cells' graphics
     def synthesize_img(self):
+        if self.compiled.atlas is not None and self.dim == 2:
+            tile_ids = self.collapsed
+            return self.compiled.render(tile_ids, self.domains.words if (tile_ids == UNCOLLAPSED).any() else None)
+        cells = self.cells
         return np.concatenate([
             np.concatenate([c.get_graphics().array for c in row], axis=1)
-            for row in self.cells], axis=0
+            for row in cells], axis=0
         )
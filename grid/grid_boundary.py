@@ -1,8 +1,12 @@
+import hashlib
 from abc import ABC, abstractmethod
 from typing import Tuple, Optional
 
+import numpy as np
+
 from grid.cell import Cell
 from grid.pos import Pos
+from tiles import bitset
 
 
 class GridBoundary(ABC):
@@ -15,6 +19,13 @@ class GridBoundary(ABC):
     def map_pos(self, grid, pos: Pos) -> Optional[Pos]:
         pass
 
+    def get_domain(self, grid, pos: Pos) -> np.ndarray:
+        return grid.cell_to_domain(self.get_cell(grid, pos))
+
+    # identifies what the boundary imposes on grid, or None if that depends on state outside of it
+    def cache_key(self, grid) -> Optional[str]:
+        return None
+
     @staticmethod
     def error_if_in_bounds(grid, pos: Pos):
         if grid.in_bounds(pos):
@@ -30,27 +41,82 @@ class PeriodicGridBoundary(GridBoundary):
     def get_cell(self, grid, pos: Pos) -> Cell:
         return grid.get_cell(self.map_pos(grid, pos))
 
+    def get_domain(self, grid, pos: Pos) -> np.ndarray:
+        return grid.get_domain(self.map_pos(grid, pos))
+
+    def cache_key(self, grid) -> Optional[str]:
+        return 'periodic'
+
 
 class ConstantGridBoundary(GridBoundary):
     def map_pos(self, grid, pos: Pos) -> Optional[Tuple[int, int]]:
         self.error_if_in_bounds(grid, pos)
         return None
 
-    def __init__(self, boundary_cell):
+    def __init__(self, boundary_cell: Optional[Cell]):
         self.boundary_cell = boundary_cell
+        self._boundary_domain = None
+
+    @classmethod
+    def from_domain(cls, words: np.ndarray):
+        boundary = cls(None)
+        boundary._boundary_domain = words
+        return boundary
 
     def get_cell(self, grid, pos: Pos) -> Cell:
         self.error_if_in_bounds(grid, pos)
+        if self.boundary_cell is None:
+            return grid.domain_to_cell(self._boundary_domain)
         return self.boundary_cell
 
+    def get_domain(self, grid, pos: Pos) -> np.ndarray:
+        self.error_if_in_bounds(grid, pos)
+        if self._boundary_domain is None:
+            self._boundary_domain = grid.cell_to_domain(self.boundary_cell)
+        return self._boundary_domain
+
+    def cache_key(self, grid) -> Optional[str]:
+        if self._boundary_domain is None:
+            self._boundary_domain = grid.cell_to_domain(self.boundary_cell)
+        return 'constant-' + self._boundary_domain.tobytes().hex()
+
 
 class SuperGridBoundary(GridBoundary):
 
     def map_pos(self, grid, pos: Pos) -> Optional[Pos]:
         self.error_if_in_bounds(grid, pos)
-        #return pos
+        return grid.wrap_into(pos)
+
+    def get_cell(self, grid, pos: Pos) -> Cell:
+        self.error_if_in_bounds(grid, pos)
+        return grid.super_grid.get_cell(pos)
+
+    def get_domain(self, grid, pos: Pos) -> np.ndarray:
+        self.error_if_in_bounds(grid, pos)
+        return grid.super_grid.get_domain(pos)
+
+
+# constant boundary read from an array of tile ids surrounding the grid, e.g. already solved neighboring regions
+# tile_ids covers the grid padded by one cell on every side, UNCOLLAPSED entries are left open
+class TileArrayBoundary(GridBoundary):
+    def __init__(self, tile_ids: np.ndarray):
+        self.tile_ids = tile_ids
+        self._tile_words = None
+
+    def map_pos(self, grid, pos: Pos) -> Optional[Pos]:
+        self.error_if_in_bounds(grid, pos)
         return None
 
     def get_cell(self, grid, pos: Pos) -> Cell:
+        return grid.domain_to_cell(self.get_domain(grid, pos))
+
+    def get_domain(self, grid, pos: Pos) -> np.ndarray:
         self.error_if_in_bounds(grid, pos)
-        return grid.super_grid.get_cell(pos)
\ No newline at end of file
+        if self._tile_words is None:
+            # one row per tile id, plus a last row with every tile that UNCOLLAPSED (-1) indexes
+            self._tile_words = bitset.from_bool(np.eye(grid.n_tiles + 1, grid.n_tiles, dtype=bool))
+            self._tile_words[-1] = bitset.full(grid.n_tiles)
+        return self._tile_words[self.tile_ids[tuple(p - bounds[0] + 1 for p, bounds in zip(pos, grid.index_bounds))]]
+
+    def cache_key(self, grid) -> Optional[str]:
+        return 'tiles-' + hashlib.sha1(np.ascontiguousarray(self.tile_ids, dtype=np.int16).tobytes()).hexdigest()
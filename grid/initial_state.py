@@ -0,0 +1,88 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from grid.domain import DomainArray
+
+
+# domains of fresh grids after their boundary has been propagated through, which only depend on the tileset, the
+# shape, the initial domain and the boundary, so that runs on identical grids can start from a copy
+# states are kept in memory, the max_entries most recently used ones, and also written to directory if given so that
+# other processes and later runs find them; grids whose boundary has no cache_key are always propagated
+class InitialStateCache:
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 16):
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.states: OrderedDict[str, DomainArray] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, grid, words: np.ndarray) -> Optional[str]:
+        boundary_key = grid.boundary.cache_key(grid)
+        if boundary_key is None:
+            return None
+        digest = hashlib.sha1()
+        for part in (grid.compiled.fingerprint(), str(grid.shape), words.tobytes().hex(), boundary_key):
+            digest.update(part.encode())
+        return digest.hexdigest()
+
+    # called by Grid.__init__ in place of constrain_boundary, with the domain every cell was filled with
+    def initialize(self, grid, words: np.ndarray):
+        key = self.key(grid, words)
+        state = None if key is None else self.get(key)
+        if state is not None:
+            self.hits += 1
+            grid.load_domains(state)
+            return
+        self.misses += 1
+        grid.constrain_boundary()
+        grid.propagate_boundary()
+        # the propagator and heuristic start out fresh either way, so that a run does not depend on whether its
+        # initial state was cached, e.g. on how many workers an ensemble is spread over
+        grid.propagator = grid.propagator_factory(grid)
+        grid.entropy_heuristic = grid.entropy_factory(grid)
+        if key is not None:
+            domains = np.array([grid.get_domain(pos) for pos in grid.pos_iterator])
+            self.put(key, DomainArray(grid.shape, grid.n_tiles, domains.reshape(grid.shape + domains.shape[-1:]),
+                                      grid.collapsed.copy()))
+
+    def get(self, key: str) -> Optional[DomainArray]:
+        if key in self.states:
+            self.states.move_to_end(key)
+            return self.states[key]
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            state = DomainArray(data['collapsed'].shape, int(data['n_tiles']), data['words'], data['collapsed'])
+        self._store(key, state)
+        return state
+
+    def put(self, key: str, state: DomainArray):
+        self._store(key, state)
+        path = self._path(key)
+        if path is not None and not os.path.exists(path):
+            # written under a temporary name first, so that concurrent readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, words=state.words, collapsed=state.collapsed, n_tiles=state.n_tiles)
+            os.replace(tmp_path, path)
+
+    def clear(self):
+        self.states.clear()
+
+    def _store(self, key: str, state: DomainArray):
+        # states are shared by every grid loaded from them, so they are made read-only
+        state.words.setflags(write=False)
+        state.collapsed.setflags(write=False)
+        self.states[key] = state
+        self.states.move_to_end(key)
+        while len(self.states) > self.max_entries:
+            self.states.popitem(last=False)
+
+    def _path(self, key: str) -> Optional[str]:
+        return None if self.directory is None else os.path.join(self.directory, f"initial_{key}.npz")
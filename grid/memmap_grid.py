@@ -0,0 +1,88 @@
+import itertools
+import os
+from typing import Tuple, Callable, Optional, List
+
+import numpy as np
+
+from grid.contradiction import Contradiction
+from grid.domain import DomainArray, UNCOLLAPSED
+from grid.entropy import EntropyHeuristic, CountEntropy
+from grid.grid import Grid
+from grid.grid_array import GridArray
+from grid.grid_boundary import GridBoundary
+from grid.sub_grid import SubGrid
+from propagator import Propagator
+from tiles.compiled import CompiledTileSet
+
+
+# GridArray whose domains live in .npy files in directory, for volumes larger than memory
+# it is solved chunk by chunk in C order so that page-ins stay sequential, and flushed after every chunk: a killed
+# run is resumed by opening the same directory again, which skips the chunks that are already collapsed
+class MemmapGridArray(GridArray):
+
+    def __init__(self, directory: str, shape: Tuple[int, ...], chunk_shape: Tuple[int, ...], boundary: GridBoundary,
+                 tile_data, propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                 entropy_factory: Callable[[Grid], EntropyHeuristic] = CountEntropy,
+                 rng: Optional[np.random.Generator] = None, compiled: Optional[CompiledTileSet] = None,
+                 resume: bool = True):
+        self.directory = directory
+        self.chunk_shape = chunk_shape
+        self.resume = resume
+        super().__init__(shape, boundary, tile_data, None, propagator_factory, entropy_factory, rng, compiled)
+
+    def populate_grid(self, words: np.ndarray):
+        resumed = self.resume and all(
+            os.path.exists(os.path.join(self.directory, name))
+            for name in (DomainArray.WORDS_FILE, DomainArray.COLLAPSED_FILE)
+        )
+        self.domains = DomainArray.open_memmap(self.directory, self.shape, self.n_tiles, resumed)
+        if not resumed:
+            for region in self.chunk_regions:
+                self.domains.fill(words, region)
+            self.domains.flush()
+
+    # every chunk is constrained by the boundary when it is solved as a SubGrid, see chunked_collapse, so the volume
+    # itself skips the pass over its faces, which is Python work for every cell on them
+    def constrain_boundary(self):
+        pass
+
+    @property
+    def chunk_regions(self) -> List[Tuple[slice, ...]]:
+        return [
+            tuple(slice(lo, min(lo + c, n)) for lo, c, n in zip(origin, self.chunk_shape, self.shape))
+            for origin in itertools.product(*(range(0, n, c) for n, c in zip(self.shape, self.chunk_shape)))
+        ]
+
+    # every chunk is solved as a SubGrid against the chunks solved before it and retried from scratch on failure
+    # the SubGrid reaches margin cells into the chunks after it, which are reset when their turn comes, so that the
+    # border it leaves behind is likely to be extendable; the later half of the attempts also reopens a band of margin
+    # cells of the chunks before it
+    def chunked_collapse(self, margin: int = 2, max_backtracks: int = 1000, max_attempts: int = 10,
+                         propagator_factory: Callable[[Grid], Propagator] = Propagator):
+        for region in self.chunk_regions:
+            if (self.domains.collapsed[region] != UNCOLLAPSED).all():
+                continue
+            for attempt in range(max_attempts):
+                back = margin if 2 * attempt >= max_attempts else 0
+                pos = tuple(max(r.start - back, 0) for r in region)
+                size = tuple(min(r.stop + margin, n) - p for r, n, p in zip(region, self.shape, pos))
+                try:
+                    chunk = SubGrid(self, pos, size, self.tile_data, None,
+                                    propagator_factory=propagator_factory, rng=self.rng)
+                    chunk.propagate_boundary()
+                    chunk.backtracking_collapse(max_backtracks)
+                    break
+                except Contradiction:
+                    continue
+            else:
+                raise Contradiction(tuple(r.start for r in region))
+            self.domains.flush()
+
+    # writes table[tile id] for every cell to a .npy file, chunk by chunk, e.g. names or transforms of the tiles
+    def write_tile_map(self, path: str, table: np.ndarray):
+        out = np.lib.format.open_memmap(
+            path, mode='w+', dtype=table.dtype, shape=self.shape + table.shape[1:]
+        )
+        for region in self.chunk_regions:
+            out[region] = table[self.domains.collapsed[region]]
+        out.flush()
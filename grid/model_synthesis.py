@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import Tuple, Callable, Optional, Dict, Union
+
+import numpy as np
+
+from grid.contradiction import Contradiction
+from grid.grid import Grid
+from grid.pos import Pos
+from tiles.names import TileNames
+from grid.sub_grid import SubGrid
+from propagator import Propagator
+
+
+@dataclass
+class BlockStats:
+    attempted: int = 0
+    succeeded: int = 0
+    backtracks: int = 0
+
+
+# model synthesis style refinement: starting from a grid that is already fully collapsed and valid (even a trivial
+# tiling), repeatedly reset a block to full domains and re-solve it against its fixed surroundings
+# a block that cannot be solved is put back as it was, so the grid stays valid after every step and the cost of a
+# failure is bounded by the block size
+def modify_in_blocks(grid: Grid, block_shape: Tuple[int, ...], steps: int, max_backtracks: int = 100,
+                     propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                     origins: Optional[np.ndarray] = None) -> BlockStats:
+    stats = BlockStats()
+    if origins is None:
+        origins = np.stack([
+            grid.rng.integers(lo, max(lo, hi - b) + 1, size=steps)
+            for (lo, hi), b in zip(grid.index_bounds, block_shape)
+        ], axis=-1)
+    for origin in origins:
+        pos = tuple(int(o) for o in origin)
+        size = tuple(min(b, hi - p) for p, b, (lo, hi) in zip(pos, block_shape, grid.index_bounds))
+        stats.attempted += 1
+        backtracks = modify_block(grid, pos, size, max_backtracks, propagator_factory)
+        if backtracks is not None:
+            stats.succeeded += 1
+            stats.backtracks += backtracks
+    return stats
+
+
+# re-solves the block pos <= p < pos + size in place and returns the backtracks used, or None if it was restored
+# pins (see Grid.pin) inside the block are applied before solving it
+def modify_block(grid: Grid, pos: Pos, size: Tuple[int, ...], max_backtracks: int = 100,
+                 propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                 pins: Optional[Dict[Pos, Union[int, TileNames, np.ndarray]]] = None) -> Optional[int]:
+    positions = [
+        tuple(p + o for p, o in zip(pos, offset)) for offset in np.ndindex(*size)
+    ]
+    old_domains = [grid.get_domain(p).copy() for p in positions]
+    try:
+        block = SubGrid(grid, pos, size, grid.tile_data, None, propagator_factory=propagator_factory, rng=grid.rng)
+        if pins is not None:
+            block.pin(pins, explain=False)
+        block.propagate_boundary()
+        backtracks = block.backtracking_collapse(max_backtracks)
+    except Contradiction:
+        for p, words in zip(positions, old_domains):
+            grid.set_domain(p, words)
+        backtracks = None
+    for p in positions:
+        grid.propagator.sync(p)
+    return backtracks
+
+
+@dataclass
+class EditStats:
+    radius: int = 0
+    attempts: int = 0
+    backtracks: int = 0
+
+
+# incremental edit of a solved grid: applies the pins by re-solving the box around them grown by radius against the
+# rest of the grid, which stays fixed, and doubles the radius whenever that fails, until the box covers the grid
+# the cost follows the size of the disturbance rather than the size of the grid; a grid that cannot be solved with
+# the pins at all is left as it was and Contradiction is raised
+def local_edit(grid: Grid, pins: Dict[Pos, Union[int, TileNames, np.ndarray]], radius: int = 1,
+               max_backtracks: int = 100, propagator_factory: Callable[[Grid], Propagator] = Propagator) -> EditStats:
+    for pos in pins:
+        if not grid.in_bounds(pos):
+            raise ValueError(f"Cannot pin cell {pos}")
+    stats = EditStats()
+    lo = np.min(list(pins), axis=0)
+    hi = np.max(list(pins), axis=0) + 1
+    while True:
+        pos = tuple(int(max(l - radius, b_lo)) for l, (b_lo, b_hi) in zip(lo, grid.index_bounds))
+        size = tuple(int(min(h + radius, b_hi)) - p for h, p, (b_lo, b_hi) in zip(hi, pos, grid.index_bounds))
+        stats.radius = radius
+        stats.attempts += 1
+        backtracks = modify_block(grid, pos, size, max_backtracks, propagator_factory, pins)
+        if backtracks is not None:
+            stats.backtracks = backtracks
+            return stats
+        if size == grid.shape:
+            raise Contradiction()
+        radius *= 2
@@ -0,0 +1,69 @@
+import itertools
+from typing import Tuple, Callable, Optional, Iterator
+
+import numpy as np
+
+from grid.domain import SparseDomainArray
+from grid.entropy import EntropyHeuristic, CountEntropy, ShannonEntropy
+from grid.entropy_queue import EntropyQueue
+from grid.grid import Grid
+from grid.grid_array import GridArray
+from grid.grid_boundary import GridBoundary
+from grid.pos import Pos
+from propagator import Propagator, SupportPropagator, WavefrontPropagator
+from tiles.compiled import CompiledTileSet
+
+
+# GridArray storing its domains in a SparseDomainArray, for volumes that are mostly uniform such as buildings in
+# empty space; call compact after collapsing to release the chunks that ended up uniform
+# the rest of its state follows the allocated chunks as well: the entropy queue holds the cells of allocated chunks
+# and a single cell of every uniform chunk, which stands in for the others as they all share its domain
+# SupportPropagator, WavefrontPropagator and ShannonEntropy keep dense arrays over every cell and are refused
+class SparseGridArray(GridArray):
+
+    def __init__(self, shape: Tuple[int, ...], chunk_shape: Tuple[int, ...], boundary: GridBoundary, tile_data,
+                 init_cell_factory=None, propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                 entropy_factory: Callable[[Grid], EntropyHeuristic] = CountEntropy,
+                 rng: Optional[np.random.Generator] = None, compiled: Optional[CompiledTileSet] = None):
+        self.chunk_shape = chunk_shape
+        super().__init__(shape, boundary, tile_data, init_cell_factory, propagator_factory, entropy_factory, rng,
+                         compiled)
+        self.domains: SparseDomainArray
+        if isinstance(self.propagator, (SupportPropagator, WavefrontPropagator)):
+            raise ValueError(f"SparseGridArray does not support {type(self.propagator).__name__}")
+        if isinstance(self.entropy_heuristic, ShannonEntropy):
+            raise ValueError("SparseGridArray does not support ShannonEntropy")
+
+    def populate_grid(self, words: np.ndarray):
+        self.domains = SparseDomainArray(self.shape, self.n_tiles, self.chunk_shape)
+        self.domains.fill(words)
+
+    def compact(self):
+        self.domains.compact()
+
+    def write_domain(self, pos: Pos, words: np.ndarray):
+        n_allocated = self.domains.n_allocated
+        super().write_domain(pos, words)
+        # the cells of a chunk that just stopped being uniform no longer share the entry of its first cell
+        if self.entropy_queue is not None and self.domains.n_allocated > n_allocated:
+            for npos in self.chunk_positions(tuple(p // c for p, c in zip(pos, self.chunk_shape))):
+                self.entropy_queue.push(npos)
+
+    def min_entropy_pos(self):
+        if self.entropy_queue is None:
+            self.entropy_queue = EntropyQueue(self.entropy, self.is_collapsed, self.rng)
+            self.entropy_queue.extend(self.queue_positions())
+        return super().min_entropy_pos()
+
+    # every cell of the allocated chunks and the first cell of every uniform one
+    def queue_positions(self) -> Iterator[Pos]:
+        for index in itertools.product(*(range(n) for n in self.domains.grid_shape)):
+            if index in self.domains.chunks:
+                yield from self.chunk_positions(index)
+            else:
+                yield tuple(i * c for i, c in zip(index, self.chunk_shape))
+
+    def chunk_positions(self, index: Pos) -> Iterator[Pos]:
+        return itertools.product(*(
+            range(i * c, min((i + 1) * c, n)) for i, c, n in zip(index, self.chunk_shape, self.shape)
+        ))
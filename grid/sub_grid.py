@@ -1,41 +1,146 @@
-from typing import Tuple, Iterable
+from typing import Tuple, Iterable, Callable, Optional, List
+
+import numpy as np
 
 from directions import Directions
-from grid.cell import Cell
+from grid.domain import DomainArray, UNCOLLAPSED
+from grid.entropy import EntropyHeuristic, CountEntropy
 from grid.grid import Grid
 from grid.grid_boundary import SuperGridBoundary
 from grid.pos import Pos
+from propagator import Propagator
+from tiles import bitset
+from tiles.compiled import CompiledTileSet
 
 
+# region pos <= p < pos + size of super_grid, solved in place against the cells around it, which are read through
+# constrain_boundary but never written
+# positions are those of the super grid; with a periodic super grid the region may reach past its edges and wraps,
+# and neighbors across the super grid's edges that fall back into the region are linked
+# when the super grid keeps its domains in a dense DomainArray, reads go straight to its arrays through the flat
+# indices of the region's cells, and words and collapsed are views of the region when it does not wrap; they fall
+# back to super_grid.get_domain once its domains are no longer that array
+# writes go through super_grid.set_domain
 class SubGrid(Grid):
 
-    def __init__(self, super_grid: Grid, pos: Pos, size: Tuple[int, ...], tile_data, init_cell_factory):
+    def __init__(self, super_grid: Grid, pos: Pos, size: Tuple[int, ...], tile_data, init_cell_factory,
+                 propagator_factory: Callable[[Grid], Propagator] = Propagator,
+                 entropy_factory: Callable[[Grid], EntropyHeuristic] = CountEntropy,
+                 rng: Optional[np.random.Generator] = None, compiled: Optional[CompiledTileSet] = None):
         self.super_grid = super_grid
         self.pos = pos
         self.size = size
+        region_positions = [tuple(p + o for p, o in zip(pos, offset)) for offset in np.ndindex(*size)]
+        self.super_positions = [super_grid_pos(super_grid, p) for p in region_positions]
+        if any(p is None for p in self.super_positions):
+            raise ValueError(f"Region {pos} of size {size} is not inside the super grid")
+        self.wraps = region_positions != self.super_positions
+        # flat index by position, which doubles as the bounds check on the hot path
+        self.region_index = {p: i for i, p in enumerate(region_positions)}
+        self.super_index = np.ravel_multi_index(
+            np.array(self.super_positions).T - np.array([b[0] for b in super_grid.index_bounds])[:, None],
+            super_grid.shape
+        )
+        self.attach_super_domains()
+        self.neighbor_rows: Optional[List[List[int]]] = None
         super().__init__(
             tuple((p, p + s) for p, s in zip(pos, size)),
             SuperGridBoundary(),
             tile_data,
-            init_cell_factory
+            init_cell_factory,
+            propagator_factory,
+            entropy_factory,
+            rng,
+            compiled if compiled is not None else super_grid.compiled
         )
 
+    # takes views of the super grid's domain arrays, or drops them if it does not keep a dense DomainArray
+    # called again whenever the super grid's domains have been replaced, e.g. by GridArray.fork, so that reads
+    # never go to arrays the super grid no longer writes to
+    def attach_super_domains(self):
+        domains = getattr(self.super_grid, 'domains', None)
+        self.super_domains = domains
+        self.super_words: Optional[np.ndarray] = None
+        self.super_collapsed: Optional[np.ndarray] = None
+        if isinstance(domains, DomainArray) and domains.words.flags.c_contiguous:
+            self.super_words = domains.words.reshape(-1, domains.n_words)
+            self.super_collapsed = domains.collapsed.reshape(-1)
+
+    @property
+    def reads_direct(self) -> bool:
+        if getattr(self.super_grid, 'domains', None) is not self.super_domains:
+            self.attach_super_domains()
+        return self.super_words is not None
+
     @property
     def directions(self) -> Iterable[Directions]:
         return self.super_grid.directions
 
-    def populate_grid(self, init_cell_factory):
+    @property
+    def words(self) -> np.ndarray:
+        # (*size, n_words) view of the super grid's domains, or a copy if the region wraps
+        if not self.reads_direct:
+            return np.array([self.get_domain(pos) for pos in self.pos_iterator]).reshape(self.shape + (-1,))
+        if self.wraps:
+            return self.super_words[self.super_index].reshape(self.shape + (-1,))
+        return self.super_grid.domains.words[self.region]
+
+    @property
+    def collapsed(self) -> np.ndarray:
+        if not self.reads_direct:
+            tile_ids = [bitset.unpack(words) for words in self.words.reshape(-1, self.compiled.n_words)]
+            return np.array([t[0] if len(t) == 1 else UNCOLLAPSED for t in tile_ids], dtype=np.int16) \
+                .reshape(self.shape)
+        if self.wraps:
+            return self.super_collapsed[self.super_index].reshape(self.shape)
+        return self.super_grid.domains.collapsed[self.region]
+
+    @property
+    def region(self) -> Tuple[slice, ...]:
+        return tuple(slice(p - lo, p - lo + s) for p, s, (lo, hi) in
+                     zip(self.pos, self.size, self.super_grid.index_bounds))
+
+    # a region is small, so its neighbors are tabulated once instead of going through the boundary every time
+    def neighbor_indices(self, i: int) -> List[int]:
+        if self.neighbor_rows is None:
+            self.neighbor_rows = self.neighbor_index_array(np.arange(int(np.prod(self.shape)))).tolist()
+        return self.neighbor_rows[i]
+
+    def populate_grid(self, words: np.ndarray):
         for pos in self.pos_iterator:
-            self.set_cell(pos, init_cell_factory())
+            self.set_domain(pos, words)
 
-    def get_cell(self, pos: Pos) -> Cell:
-        if self.in_bounds(pos):
-            return self.super_grid.get_cell(pos)
+    def get_domain(self, pos: Pos) -> np.ndarray:
+        i = self.region_index.get(pos)
+        if i is not None:
+            return self.get_domain_at(i)
         else:
-            return self.boundary.get_cell(self, pos)
+            return self.boundary.get_domain(self, pos)
 
-    def set_cell(self, pos: Pos, cell: Cell):
-        if self.in_bounds(pos):
-            self.super_grid.set_cell(pos, cell)
+    def get_domain_at(self, i: int) -> np.ndarray:
+        if not self.reads_direct:
+            return self.super_grid.get_domain(self.super_positions[i])
+        return self.super_words[self.super_index[i]]
+
+    def write_domain(self, pos: Pos, words: np.ndarray):
+        i = self.region_index.get(pos)
+        if i is not None:
+            self.super_grid.set_domain(self.super_positions[i], words)
         else:
             raise ValueError(f"Cannot set cell {pos}")
+
+    # the position inside the region that pos outside of it wraps around to, if any
+    def wrap_into(self, pos: Pos) -> Optional[Pos]:
+        spos = super_grid_pos(self.super_grid, pos)
+        if spos is None:
+            return None
+        npos = tuple(lo + (p - lo) % n for p, (lo, hi), n in zip(spos, self.index_bounds, self.super_grid.shape))
+        return npos if self.in_bounds(npos) else None
+
+
+# pos in the super grid, wrapped by its boundary if it lies outside, or None if the boundary does not map it
+def super_grid_pos(super_grid: Grid, pos: Pos) -> Optional[Pos]:
+    if super_grid.in_bounds(pos):
+        return pos
+    npos = super_grid.boundary.map_pos(super_grid, pos)
+    return npos if npos is not None and super_grid.in_bounds(npos) else None
@@ -0,0 +1,32 @@
+from typing import List, Tuple, Iterator
+
+import numpy as np
+
+from grid.pos import Pos
+
+
+# undo log of domain changes: every write records the domain it replaced, and every collapse decision opens a
+# checkpoint so that the grid can be rolled back to the state just before that decision
+class Trail:
+    def __init__(self):
+        self.entries: List[Tuple[Pos, np.ndarray]] = []
+        self.checkpoints: List[Tuple[int, Pos, int]] = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def depth(self) -> int:
+        return len(self.checkpoints)
+
+    def record(self, pos: Pos, old_words: np.ndarray):
+        self.entries.append((pos, old_words.copy()))
+
+    def checkpoint(self, pos: Pos, tile: int):
+        self.checkpoints.append((len(self.entries), pos, tile))
+
+    def pop_checkpoint(self) -> Tuple[Iterator[Tuple[Pos, np.ndarray]], Pos, int]:
+        length, pos, tile = self.checkpoints.pop()
+        undone = self.entries[length:]
+        del self.entries[length:]
+        return reversed(undone), pos, tile
@@ -1,8 +1,12 @@
+import os
+
 import numpy as np
 
+from animation import FrameRenderer, FrameWriter, record_collapse
 from grid.cell import CollapsedCell, UncollapsedCell
 from grid.grid_array import GridArray
 from grid.grid_boundary import ConstantGridBoundary, PeriodicGridBoundary
+from grid.memmap_grid import MemmapGridArray
 from grid.sub_grid import SubGrid
 from symmetry.planar_groups import PlanarGroupAction
 from symmetry.cubic_groups import CUBIC_GROUP
@@ -71,6 +75,19 @@ def make_generic_grid_3d(tileset: TileSet):
     np.save('building_transform.npy', transform_array)
     np.save('building_name.npy', name_array)
 
+
+# out-of-core version of make_generic_grid_3d: the tile ids end up in directory/collapsed.npy and the outputs are
+# written next to them chunk by chunk; rerunning it after an interruption resumes from the last solved chunk
+def make_memmap_grid_3d(tileset: TileSet, directory: str):
+    shape = (2048, 2048, 64)
+    grid = MemmapGridArray(directory, shape, (64, 64, 64),
+                           boundary=ConstantGridBoundary(UncollapsedCell.with_any_tile(tileset)),
+                           tile_data=tileset.tile_data)
+    grid.chunked_collapse()
+    grid.write_tile_map(os.path.join(directory, 'building_transform.npy'), grid.compiled.transforms)
+    grid.write_tile_map(os.path.join(directory, 'building_name.npy'),
+                        np.array([name[0] for name in grid.compiled.tile_values]))
+
 def make_directed_pipe_grid():
     tileset = DirectedPipeTileSet()
     width, height = 20, 20
@@ -85,7 +102,7 @@ def make_directed_pipe_grid():
 
     grid = GridArray((width, height),
                      boundary=ConstantGridBoundary(CollapsedCell(tileset.tile_data, empty_tile)),
-                     # boundary=PeriodicGridBoundary(), # todo: not working properly with sub grid
+                     # boundary=PeriodicGridBoundary(),
                      tile_data=tileset.tile_data,
                      init_cell_factory=lambda: CollapsedCell(tileset.tile_data, empty_tile)
                      # init_cell_factory=lambda: UncollapsedCell.with_any_tile(tileset)
@@ -112,12 +129,9 @@ def make_directed_pipe_grid():
 def place_emitter_consumer(tileset, grid):
     emitter_tile = next(iter(tileset.get_tile_names(DirectedPipeTileSet.proto_tile_name_enum.EMITTER)))
     consumer_tile = next(iter(tileset.get_tile_names(DirectedPipeTileSet.proto_tile_name_enum.CONSUMER)))
-    for (i, j), tile in zip(
-            [(5, 5), (15, 15), (6, 14), (13, 4)],
-            [emitter_tile, consumer_tile, emitter_tile, consumer_tile]
-    ):
-        grid.cells[i, j] = CollapsedCell(tileset.tile_data, tile)
-        grid.collapse(i, j)
+    grid.pin({
+        (5, 5): emitter_tile, (15, 15): consumer_tile, (6, 14): emitter_tile, (13, 4): consumer_tile
+    })
 
 
 def collapse_animation(grid):
@@ -136,7 +150,8 @@ def collapse_animation_2(update_grid, display_grid):
     from matplotlib.animation import FuncAnimation
 
     fig = plt.figure()
-    img = plt.imshow(display_grid.synthesize_img(), cmap='gray', animated=True)
+    renderer = FrameRenderer(display_grid)
+    img = plt.imshow(renderer.frame, cmap='gray', animated=True)
     pos_iter = update_grid.pos_iterator
 
     # pos_iter = update_grid.min_entropy_pos_iterator
@@ -144,7 +159,8 @@ def collapse_animation_2(update_grid, display_grid):
     def update(*args):
         pos = next(pos_iter)
         update_grid.propagated_collapse(pos)
-        img.set_array(display_grid.synthesize_img())
+        renderer.update()
+        img.set_array(renderer.frame)
         return [img]
 
     try:
@@ -155,6 +171,13 @@ def collapse_animation_2(update_grid, display_grid):
         pass
 
 
+# same as collapse_animation_2 without a window, e.g. for ffmpeg -f rawvideo or np.load(path, mmap_mode='r')
+def collapse_frames(update_grid, display_grid, path, format='npy'):
+    frame_shape = tuple(n * s for n, s in zip(display_grid.shape, display_grid.compiled.atlas.shape[1:3]))
+    with FrameWriter(path, frame_shape, format=format) as writer:
+        record_collapse(update_grid, display_grid, writer)
+
+
 def pixel_test(tileset):
     tile_I = tileset.tile_name_enum('4_I')
     tile_Tx = tileset.tile_name_enum('4_ITx')
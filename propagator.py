@@ -1,24 +1,293 @@
-from typing import List, Tuple
+from collections import deque
+from typing import List, Deque, Tuple, Optional, Iterable, Dict, Set
 
-from grid.grid import Pos
+import numpy as np
 
+from grid.contradiction import Contradiction
+from grid.cow_array import CowArray
+from grid.pos import Pos
+from tiles import bitset
 
+
+# works on flat cell indices through grid.neighbor_indices; only positions outside the grid, which
+# constrain_boundary passes in, go through get_neighbor_dict
 class Propagator:
     def __init__(self, grid: "Grid"):
-        self.stack: List[Pos] = []
+        self.stack: List[int] = []
         self.grid = grid
 
     def constrain(self, pos: Pos):
+        if self.grid.in_bounds(pos):
+            self.constrain_index(self.grid.flat_index(pos))
+            return
+        words = self.grid.get_domain(pos)
         for direction, npos in self.grid.get_neighbor_dict(pos).items():
-            compatible_tiles = self.grid.get_cell(pos).get_compatible_tiles(direction)
-            prev_len = len(self.grid.get_cell(npos).tiles)
-            self.grid.set_cell(npos, self.grid.get_cell(npos).constrain(compatible_tiles))
-            new_len = len(self.grid.get_cell(npos).tiles)
-            if new_len != prev_len:
-                self.stack.append(npos)
+            self._narrow(self.grid.flat_index(npos), self.grid.compiled.direction_index[direction], words)
+
+    def constrain_index(self, i: int):
+        words = self.grid.get_domain_at(i)
+        for k, j in enumerate(self.grid.neighbor_indices(i)):
+            if j != self.grid.NO_NEIGHBOR:
+                self._narrow(j, k, words)
+
+    def _narrow(self, j: int, k: int, words: np.ndarray):
+        compatible_words = self.grid.compiled.compatible_domain(words, k)
+        prev_words = self.grid.get_domain_at(j)
+        new_words = prev_words & compatible_words
+        if not new_words.any():
+            raise Contradiction(self.grid.position(j))
+        if (new_words != prev_words).any():
+            self.grid.set_domain_at(j, new_words)
+            self.stack.append(j)
+
+    def sync(self, pos: Pos):
+        pass
+
+    # propagator of grid, a fork of this one's grid (see GridArray.fork), that shares this one's state copy-on-write
+    def fork(self, grid: "Grid") -> "Propagator":
+        return type(self)(grid)
 
     def propagate_from(self, pos: Pos):
-        self.stack = [pos]
+        self.propagate_from_all([pos])
+
+    def propagate_from_all(self, positions: Iterable[Pos]):
+        self.stack = [self.grid.flat_index(pos) for pos in positions]
         while len(self.stack) > 0:
-            self.constrain(self.stack.pop())
+            self.constrain_index(self.stack.pop())
             # print(self.stack)
+
+
+# AC-4 style propagation: for every cell, direction and tile we count the tiles in the neighbor that support it,
+# and only remove a tile once its count drops to zero.
+# Removals are gathered per cell and the support they took away is subtracted for all of a cell's removed tiles and
+# directions at once; the grid is written once per touched cell when the queue has drained.
+class SupportPropagator(Propagator):
+
+    def __init__(self, grid: "Grid"):
+        super().__init__(grid)
+        # cells whose removed tiles have not been subtracted from the support of their neighbors yet, with those tiles
+        self.queue: Deque[int] = deque()
+        self.removed: Dict[int, np.ndarray] = {}
+        # cells that gained tiles outside of propagation (e.g. in a rollback) or lost neighbor tiles in a sync, whose
+        # support is checked on the next propagation
+        self.unchecked: Set[int] = set()
+        self.neighbors: Optional[np.ndarray] = None
+        self.known: Optional[CowArray] = None
+        self.support: Optional[CowArray] = None
+        self.contributions: Optional[np.ndarray] = None
+
+    @property
+    def initialized(self) -> bool:
+        return self.support is not None
+
+    def initialize(self):
+        compiled = self.grid.compiled
+        directions, reverse, compatible = compiled.directions, compiled.reverse, compiled.compatible
+        n_tiles, n_directions = compiled.n_tiles, len(directions)
+
+        n_cells = int(np.prod(self.grid.shape))
+        # the support counts already take n_directions * n_tiles per cell, so a neighbor table is cheap next to them
+        self.neighbors = self.grid.neighbor_index_array(np.arange(n_cells))
+        has_neighbor = self.neighbors != self.grid.NO_NEIGHBOR
+
+        # contributions[t, k] is the support tile t gives the tiles of its neighbor in direction k, which that
+        # neighbor counts in direction reverse(k)
+        dtype = np.int16 if n_tiles < 2 ** 15 else np.int32
+        self.contributions = compatible[reverse].transpose(2, 0, 1).astype(dtype)
+
+        known = bitset.to_bool(np.array([self.grid.get_domain(pos) for pos in self.grid.pos_iterator]), n_tiles)
+        support = np.zeros((n_cells, n_directions, n_tiles), dtype=dtype)
+        for k in range(n_directions):
+            # counts are small integers, which float32 products hold exactly
+            support[has_neighbor[:, k], k] = known[self.neighbors[has_neighbor[:, k], k]].astype(np.float32) @ \
+                compatible[k].T.astype(np.float32)
+        self.known, self.support = CowArray(known), CowArray(support)
+        unsupported = known & ((support == 0) & has_neighbor[:, :, None]).any(axis=1)
+        for i in np.flatnonzero(unsupported.any(axis=1)).tolist():
+            self._remove(i, unsupported[i])
+
+    def fork(self, grid: "Grid") -> "SupportPropagator":
+        propagator = super().fork(grid)
+        if self.initialized:
+            propagator.neighbors, propagator.contributions = self.neighbors, self.contributions
+            propagator.known, propagator.support = self.known.fork(), self.support.fork()
+            propagator.unchecked = set(self.unchecked)
+        return propagator
+
+    def _shift_support(self, i: int, tiles: np.ndarray, sign: int) -> Tuple[np.ndarray, np.ndarray]:
+        # adds (or takes away) the support of the given tiles of cell i to its neighbors, which are returned together
+        # with the direction each of them counts cell i in
+        has_neighbor = self.neighbors[i] != self.grid.NO_NEIGHBOR
+        cells, slots = self.neighbors[i][has_neighbor], self.grid.compiled.reverse[has_neighbor]
+        delta = self.contributions[tiles].sum(axis=0, dtype=self.support.dtype)[has_neighbor]
+        if sign < 0:
+            self.support[cells, slots] -= delta
+        else:
+            self.support[cells, slots] += delta
+        return cells, slots
+
+    def _remove(self, i: int, tiles: np.ndarray):
+        self.known[i] &= ~tiles
+        if i in self.removed:
+            self.removed[i] |= tiles
+        else:
+            self.removed[i] = tiles.copy()
+            self.queue.append(i)
+
+    def sync(self, pos: Pos):
+        if self.initialized and self.grid.in_bounds(pos):
+            self.sync_index(self.grid.flat_index(pos))
+
+    def sync_index(self, i: int):
+        current = bitset.to_bool(self.grid.get_domain_at(i), self.grid.n_tiles)
+        added = np.flatnonzero(current & ~self.known[i])
+        removed = np.flatnonzero(self.known[i] & ~current)
+        self.known[i] = current
+        if len(added) > 0:
+            self._shift_support(i, added, 1)
+            self.unchecked.add(i)
+        if len(removed) > 0:
+            cells, _ = self._shift_support(i, removed, -1)
+            self.unchecked.update(cells.tolist())
+
+    def constrain(self, pos: Pos):
+        super().constrain(pos)
+        if self.initialized:
+            # pos and its neighbors may have been written around the propagator, e.g. by a pin
+            for npos in [pos] + list(self.grid.get_neighbor_dict(pos).values()):
+                self.sync(npos)
+            for i in self.stack:
+                self.sync_index(i)
+        self.stack = []
+
+    def propagate_from_all(self, positions: Iterable[Pos]):
+        positions = list(positions)
+        touched: Set[int] = set()
+        try:
+            if self.initialized:
+                for pos in positions:
+                    self.sync(pos)
+            else:
+                self.initialize()
+            touched.update(self.removed)
+            # entries can go stale while several cells are re-synced at once (e.g. after a rollback), so every
+            # direction of these cells is checked against the counts as they are now
+            for i in self.unchecked:
+                has_neighbor = self.neighbors[i] != self.grid.NO_NEIGHBOR
+                unsupported = self.known[i] & (self.support[i][has_neighbor] == 0).any(axis=0)
+                if unsupported.any():
+                    self._remove(i, unsupported)
+                    touched.add(i)
+            self.unchecked.clear()
+
+            while len(self.queue) > 0:
+                i = self.queue.popleft()
+                cells, slots = self._shift_support(i, np.flatnonzero(self.removed.pop(i)), -1)
+                if not self.known[i].any():
+                    raise Contradiction(self.grid.position(i))
+                unsupported = self.known[cells] & (self.support[cells, slots] == 0)
+                for j in np.flatnonzero(unsupported.any(axis=1)).tolist():
+                    self._remove(int(cells[j]), unsupported[j])
+                    touched.add(int(cells[j]))
+        finally:
+            # the removals still queued are subtracted as well, so the counts match known for the rollback's sync
+            while len(self.queue) > 0:
+                i = self.queue.popleft()
+                self._shift_support(i, np.flatnonzero(self.removed.pop(i)), -1)
+            self.unchecked.clear()
+            self._write(touched)
+
+    def _write(self, cells: Set[int]):
+        cells = np.fromiter(cells, dtype=np.int64, count=len(cells))
+        for i, words in zip(cells.tolist(), bitset.from_bool(self.known[cells])):
+            self.grid.set_domain_at(i, words)
+
+
+# Propagates a whole frontier of changed cells per step with array operations instead of one cell at a time.
+# The allowed neighbor tiles of every frontier cell in every direction come from one batched product against the
+# compatibility matrices, and the cells whose domains shrink become the next frontier.
+class WavefrontPropagator(Propagator):
+
+    def __init__(self, grid: "Grid"):
+        super().__init__(grid)
+        self.known: Optional[CowArray] = None
+        self.transfer: Optional[np.ndarray] = None
+
+    @property
+    def initialized(self) -> bool:
+        return self.known is not None
+
+    def initialize(self):
+        compiled = self.grid.compiled
+        n_tiles = compiled.n_tiles
+
+        # (n_tiles, n_directions * n_tiles): domains @ transfer gives the allowed tiles in every direction at once
+        self.transfer = compiled.compatible.transpose(1, 0, 2).reshape(n_tiles, -1).astype(np.float32)
+        self.known = CowArray(bitset.to_bool(
+            np.array([self.grid.get_domain(pos) for pos in self.grid.pos_iterator]), n_tiles
+        ))
+
+    def fork(self, grid: "Grid") -> "WavefrontPropagator":
+        propagator = super().fork(grid)
+        if self.initialized:
+            propagator.transfer, propagator.known = self.transfer, self.known.fork()
+        return propagator
+
+    def sync(self, pos: Pos):
+        if self.initialized and self.grid.in_bounds(pos):
+            self.sync_index(self.grid.flat_index(pos))
+
+    def sync_index(self, i: int):
+        self.known[i] = bitset.to_bool(self.grid.get_domain_at(i), self.grid.n_tiles)
+
+    def constrain(self, pos: Pos):
+        super().constrain(pos)
+        self.sync(pos)
+        if self.initialized:
+            for i in self.stack:
+                self.sync_index(i)
+        self.stack = []
+
+    def propagate_from_all(self, positions: Iterable[Pos]):
+        positions = list(positions)
+        if self.initialized:
+            for pos in positions:
+                self.sync(pos)
+        else:
+            self.initialize()
+        n_tiles, n_directions = self.grid.n_tiles, len(self.grid.direction_steps)
+        frontier = np.unique([self.grid.flat_index(pos) for pos in positions])
+        while len(frontier) > 0:
+            allowed = ((self.known[frontier].astype(np.float32) @ self.transfer) > 0) \
+                .reshape(len(frontier), n_directions, n_tiles)
+            neighbors = self._neighbors(frontier)
+            changed = []
+            for k in range(n_directions):
+                cells = neighbors[:, k]
+                has_neighbor = cells != self.grid.NO_NEIGHBOR
+                cells = cells[has_neighbor]
+                prev = self.known[cells]
+                new = prev & allowed[has_neighbor, k]
+                shrunk = (new != prev).any(axis=1)
+                cells, new = cells[shrunk], new[shrunk]
+                self.known[cells] = new
+                changed.append(cells)
+            frontier = np.unique(np.concatenate(changed))
+            self._write(frontier)
+
+    def _neighbors(self, frontier: np.ndarray) -> np.ndarray:
+        # neighbors of the frontier only, so that no table over the whole grid is kept; most frontiers are a few
+        # cells, which are quicker to look up one by one
+        if len(frontier) > 16:
+            return self.grid.neighbor_index_array(frontier)
+        neighbors = np.empty((len(frontier), len(self.grid.direction_steps)), dtype=np.int32)
+        for row, i in enumerate(frontier.tolist()):
+            neighbors[row] = self.grid.neighbor_indices(i)
+        return neighbors
+
+    def _write(self, cells: np.ndarray):
+        for i, words in zip(cells.tolist(), bitset.from_bool(self.known[cells])):
+            self.grid.set_domain_at(i, words)
+        empty = cells[~self.known[cells].any(axis=1)]
+        if len(empty) > 0:
+            raise Contradiction(self.grid.position(int(empty[0])))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from grid.contradiction import Contradiction
+from grid.grid_array import GridArray
+from grid.grid_boundary import ConstantGridBoundary, PeriodicGridBoundary
+from grid.memmap_grid import MemmapGridArray
+from grid.sparse_grid import SparseGridArray
+from tiles import bitset
+
+
+# builds a grid of a compiled tileset seeded with seed, with a periodic boundary or, if not periodic, a boundary that
+# allows every tile; a chunk_shape makes it a SparseGridArray, and a directory as well a MemmapGridArray
+@pytest.fixture
+def make_grid():
+    def make(compiled, shape, seed=0, periodic=True, boundary=None, chunk_shape=None, directory=None, **kwargs):
+        if boundary is None:
+            boundary = PeriodicGridBoundary() if periodic else \
+                ConstantGridBoundary.from_domain(bitset.full(compiled.n_tiles))
+        rng = np.random.default_rng(seed)
+        if directory is not None:
+            return MemmapGridArray(str(directory), shape, chunk_shape, boundary, None, compiled=compiled, rng=rng,
+                                   **kwargs)
+        if chunk_shape is not None:
+            return SparseGridArray(shape, chunk_shape, boundary, None, compiled=compiled, rng=rng, **kwargs)
+        return GridArray(shape, boundary, None, compiled=compiled, rng=rng, **kwargs)
+    return make
+
+
+# domains after every collapse, up to the first contradiction, whose position ends the list
+@pytest.fixture
+def collapse_steps():
+    def steps_of(grid, positions):
+        steps = []
+        try:
+            for pos in positions:
+                grid.propagated_collapse(pos)
+                steps.append(grid.domains.words.copy())
+        except Contradiction as error:
+            steps.append(error.pos)
+        return steps
+    return steps_of
+
+
+# pins of two neighboring tiles, at pos and after it along the first direction, that cannot be next to each other
+@pytest.fixture
+def conflicting_pins():
+    def pins(compiled, shape, pos):
+        k = 0
+        a = int(np.flatnonzero(compiled.weights > 0)[0])
+        b = int(np.flatnonzero(~compiled.compatible[k, a])[0])
+        neighbor = tuple((p + o) % n for p, o, n in zip(pos, compiled.directions[k].value, shape))
+        return {pos: a, neighbor: b}
+    return pins
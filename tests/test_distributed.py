@@ -0,0 +1,78 @@
+import socket
+import threading
+import time
+
+import numpy as np
+
+from distributed import Coordinator, send_message, recv_message, start_local_workers
+from tile_data.pipe_data import PipeTileSet
+
+SHAPE = (32, 32)
+BLOCK_SHAPE = (8, 8)
+
+
+def test_messages_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        tile_ids = np.arange(-1, 11, dtype=np.int16).reshape(3, 4)
+        send_message(left, {'type': 'result', 'id': 3, 'ok': True}, tile_ids)
+        header, payload = recv_message(right)
+        assert header == {'type': 'result', 'id': 3, 'ok': True, 'shape': [3, 4]}
+        assert payload.dtype == np.int16
+        assert np.array_equal(payload, tile_ids)
+
+        send_message(right, {'type': 'done'})
+        assert recv_message(left) == ({'type': 'done'}, None)
+
+
+def test_localhost_run_is_valid_and_reproducible():
+    results = []
+    for n_workers in (1, 2):
+        coordinator = Coordinator(PipeTileSet, SHAPE, BLOCK_SHAPE, seed=3, job_timeout=10.)
+        workers = start_local_workers(coordinator.address, n_workers)
+        results.append(coordinator.run())
+        for worker in workers:
+            worker.join(10.)
+            assert worker.exitcode == 0
+    compiled = PipeTileSet().compiled
+    assert (results[0] >= 0).all()
+    assert not compiled.conflicts(results[0]).any()
+    assert np.array_equal(results[0], results[1])
+
+
+def test_killed_worker_job_is_reassigned():
+    reference = Coordinator(PipeTileSet, SHAPE, BLOCK_SHAPE, seed=5, job_timeout=10.)
+    start_local_workers(reference.address, 1)
+    expected = reference.run()
+
+    coordinator = Coordinator(PipeTileSet, SHAPE, BLOCK_SHAPE, seed=5, job_timeout=10.)
+    requeued = []
+    requeue = coordinator._requeue
+
+    def record(job):
+        requeued.append(job.id)
+        requeue(job)
+
+    coordinator._requeue = record
+    [victim] = start_local_workers(coordinator.address, 1)
+    result = {}
+    runner = threading.Thread(target=lambda: result.setdefault('tile_ids', coordinator.run()), daemon=True)
+    runner.start()
+    # with a single worker connected, a running job is one the victim holds
+    deadline = time.monotonic() + 30.
+    while len(coordinator.running) == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    victim.terminate()
+    victim.join(10.)
+    workers = start_local_workers(coordinator.address, 1)
+    runner.join(60.)
+
+    assert not runner.is_alive()
+    assert len(requeued) == 1
+    assert coordinator.n_done == len(coordinator.jobs)
+    compiled = PipeTileSet().compiled
+    assert not compiled.conflicts(result['tile_ids']).any()
+    assert np.array_equal(result['tile_ids'], expected)
+    workers[0].join(10.)
+    assert workers[0].exitcode == 0
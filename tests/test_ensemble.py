@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from ensemble import generate_ensemble, periodic_boundary, EnsembleOptions
+from grid.contradiction import Contradiction
+from tile_data.directed_pipe_data import DirectedPipeTileSet
+from tile_data.pipe_data import PipeTileSet
+from tiles import bitset
+
+
+def test_zero_weight_domain_is_a_contradiction(make_grid):
+    compiled = DirectedPipeTileSet().compiled
+    grid = make_grid(compiled, (4, 4))
+    zero = np.flatnonzero(compiled.weights == 0)
+    assert len(zero) > 0
+    with pytest.raises(Contradiction) as error:
+        grid.collapse_domain(bitset.pack(zero.tolist(), compiled.n_tiles), (1, 2))
+    assert error.value.pos == (1, 2)
+
+
+def test_zero_weight_runs_are_retried():
+    results = generate_ensemble(DirectedPipeTileSet, (12, 12), range(8), periodic_boundary,
+                                EnsembleOptions(min_entropy=False), processes=2)
+    compiled = DirectedPipeTileSet().compiled
+    assert [r.seed for r in results] == list(range(8))
+    for result in results:
+        if result.succeeded:
+            assert (result.tile_ids >= 0).all()
+            assert not compiled.conflicts(result.tile_ids).any()
+    assert any(r.succeeded for r in results)
+
+
+def test_ensemble_is_reproducible_from_the_seed():
+    options = EnsembleOptions(max_backtracks=100)
+    one = generate_ensemble(PipeTileSet, (10, 10), [3, 4, 5], options=options, processes=1)
+    two = generate_ensemble(PipeTileSet, (10, 10), [5, 3, 4], options=options, processes=2)
+    by_seed = {r.seed: r for r in two}
+    compiled = PipeTileSet().compiled
+    for result in one:
+        assert result.succeeded
+        assert not compiled.conflicts(result.tile_ids).any()
+        assert np.array_equal(result.tile_ids, by_seed[result.seed].tile_ids)
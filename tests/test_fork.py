@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from grid.entropy import ShannonEntropy
+from propagator import Propagator, SupportPropagator, WavefrontPropagator
+from tile_data.pipe_data import PipeTileSet
+
+COMPILED = PipeTileSet().compiled
+
+
+@pytest.fixture
+def partly_collapsed(make_grid):
+    def make(propagator_factory):
+        grid = make_grid(COMPILED, (16, 16), periodic=False, propagator_factory=propagator_factory,
+                         entropy_factory=ShannonEntropy)
+        collapse(grid, 40)
+        return grid
+    return make
+
+
+def collapse(grid, n):
+    positions = []
+    for _ in range(n):
+        positions.append(grid.min_entropy_pos()[0])
+        grid.collapse(positions[-1])
+    return positions
+
+
+@pytest.mark.parametrize('propagator_factory', [Propagator, SupportPropagator, WavefrontPropagator])
+def test_fork_continues_like_its_parent(partly_collapsed, propagator_factory):
+    grid = partly_collapsed(propagator_factory)
+    fork = grid.fork()
+    assert collapse(fork, 10) == collapse(grid, 10)
+    assert np.array_equal(fork.domains.words, grid.domains.words)
+
+
+def test_fork_shares_propagator_and_entropy_state(partly_collapsed):
+    grid = partly_collapsed(SupportPropagator)
+    support = np.asarray(grid.propagator.support)
+    sum_weights = np.asarray(grid.entropy_heuristic.sum_weights)
+    fork = grid.fork()
+    assert fork.propagator.support.base is grid.propagator.support.base
+    assert fork.entropy_heuristic.sum_weights.base is grid.entropy_heuristic.sum_weights.base
+    assert len(fork.propagator.support.changes) == 0
+
+    collapse(fork, 3)
+    assert 0 < len(fork.propagator.support.changes) < int(np.prod(grid.shape))
+    assert np.array_equal(np.asarray(grid.propagator.support), support)
+    assert np.array_equal(np.asarray(grid.entropy_heuristic.sum_weights), sum_weights)
+    fresh = SupportPropagator(fork)
+    fresh.initialize()
+    assert np.array_equal(np.asarray(fresh.support), np.asarray(fork.propagator.support))
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from grid.cell import CollapsedCell
+from grid.grid_array import GridArray
+from grid.grid_boundary import PeriodicGridBoundary
+from tile_data.pipe_data import PipeTileSet
+
+
+def test_cells_are_read_only():
+    tileset = PipeTileSet()
+    grid = GridArray((4, 4), PeriodicGridBoundary(), tileset.tile_data, rng=np.random.default_rng(0))
+    tile = next(iter(tileset.tile_data))
+    with pytest.raises(ValueError):
+        grid.cells[1, 1] = CollapsedCell(tileset.tile_data, tile)
+
+    grid.pin({(1, 1): tile})
+    assert grid.cells[1, 1].tile == tile
+    assert grid.cells[1, 1].get_compatible_tiles(next(iter(grid.directions))) == \
+        grid.get_cell((1, 1)).get_compatible_tiles(next(iter(grid.directions)))
+
+
+@pytest.mark.parametrize('periodic', [True, False])
+def test_neighbor_indices_reuse_one_buffer(make_grid, periodic):
+    grid = make_grid(PipeTileSet().compiled, (5, 7), periodic=periodic)
+    table = grid.neighbor_index_array(np.arange(35))
+    assert table.dtype == np.int32
+    assert periodic != (table == grid.NO_NEIGHBOR).any()
+    first = grid.neighbor_indices(0)
+    for i in range(35):
+        neighbors = grid.neighbor_indices(i)
+        assert neighbors is first
+        assert neighbors == table[i].tolist()
+
+
+def test_batch_cells_are_independent_and_passed_over_cells_stay_queued(make_grid):
+    compiled = PipeTileSet().compiled
+    grid = make_grid(compiled, (12, 12), periodic=False)
+    grid.min_entropy_pos()
+    n_queued = len(grid.entropy_queue)
+    batch = grid.independent_min_entropy_positions(16, 64)
+    assert 0 < len(batch) <= 16
+    assert len(grid.entropy_queue) == n_queued - len(batch)
+    for k, pos in enumerate(batch):
+        neighborhood = {pos, *grid.get_neighbor_dict(pos).values()}
+        assert all(neighborhood.isdisjoint({other, *grid.get_neighbor_dict(other).values()}) for other in batch[:k])
+
+    grid.batch_collapse(16)
+    assert (grid.collapsed >= 0).all()
+    assert not compiled.conflicts(grid.collapsed).any()
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from tile_data.pipe_data import PipeTileSet
+from tiles.image import to_uint8
+
+COMPILED = PipeTileSet().compiled
+SHAPE = (21, 13)
+
+
+# a partly collapsed dense, forked or sparse grid
+@pytest.fixture
+def partly_collapsed(make_grid):
+    def make(kind):
+        grid = make_grid(COMPILED, SHAPE, chunk_shape=(8, 8) if kind == 'sparse' else None)
+        for pos in list(grid.pos_iterator)[:150]:
+            grid.propagated_collapse(pos)
+        return grid.fork() if kind == 'forked' else grid
+    return make
+
+
+@pytest.mark.parametrize('kind', ['dense', 'forked', 'sparse'])
+def test_blocks_match_the_dense_domains(partly_collapsed, kind):
+    grid = partly_collapsed(kind)
+    words, collapsed = grid.domains.words, grid.domains.collapsed
+    for lo, hi in [((0, 0), SHAPE), ((3, 5), (17, 9)), ((8, 0), (9, 13))]:
+        region = tuple(slice(l, h) for l, h in zip(lo, hi))
+        block_words, block_collapsed = grid.domains.block(lo, hi)
+        assert np.array_equal(block_words, words[region])
+        assert np.array_equal(block_collapsed, collapsed[region])
+
+
+@pytest.mark.parametrize('kind', ['dense', 'forked', 'sparse'])
+def test_written_image_matches_the_render(partly_collapsed, kind, tmp_path):
+    grid = partly_collapsed(kind)
+    path = str(tmp_path / 'map.npy')
+    grid.write_image(path, band_rows=4)
+    assert np.array_equal(np.load(path), to_uint8(grid.synthesize_img()))
+
+
+@pytest.mark.parametrize('kind', ['forked', 'sparse'])
+def test_bands_do_not_assemble_the_grid(partly_collapsed, kind, tmp_path, monkeypatch):
+    grid = partly_collapsed(kind)
+
+    def dense(_):
+        raise AssertionError("assembled the whole grid")
+
+    monkeypatch.setattr(type(grid.domains), 'words', property(dense))
+    monkeypatch.setattr(type(grid.domains), 'collapsed', property(dense))
+    grid.write_image(str(tmp_path / 'map.png'), band_rows=4)
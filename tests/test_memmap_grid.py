@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from grid.grid_boundary import ConstantGridBoundary
+from tile_data.pipe_data import PipeTileSet
+from tiles import bitset
+
+COMPILED = PipeTileSet().compiled
+EMPTY = 0
+
+
+@pytest.fixture
+def make_memmap(make_grid, tmp_path):
+    def make(seed):
+        boundary = ConstantGridBoundary.from_domain(bitset.pack([EMPTY], COMPILED.n_tiles))
+        return make_grid(COMPILED, (24, 24), seed, boundary=boundary, chunk_shape=(8, 8), directory=tmp_path)
+    return make
+
+
+def test_chunks_are_solved_against_the_boundary(make_memmap):
+    grid = make_memmap(0)
+    grid.chunked_collapse()
+    tile_ids = np.array(grid.domains.collapsed)
+    assert (tile_ids >= 0).all()
+    assert not COMPILED.conflicts(tile_ids).any()
+    # every cell on the border is compatible with the boundary tile outside of it
+    for k, direction in enumerate(COMPILED.directions):
+        edge = tuple(-1 if d > 0 else 0 if d < 0 else slice(None) for d in direction.value)
+        assert COMPILED.compatible[k, tile_ids[edge], EMPTY].all()
+
+
+def test_resume_keeps_solved_chunks(make_memmap, tmp_path):
+    grid = make_memmap(1)
+    grid.chunked_collapse()
+    solved = np.array(grid.domains.collapsed)
+    del grid
+    resumed = make_memmap(2)
+    resumed.chunked_collapse()
+    assert np.array_equal(np.load(tmp_path / 'collapsed.npy'), solved)
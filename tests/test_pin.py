@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from grid.contradiction import PinContradiction
+from grid.domain import UNCOLLAPSED
+from propagator import Propagator, SupportPropagator, WavefrontPropagator
+from tile_data.directed_pipe_data import DirectedPipeTileSet
+
+TILESET = DirectedPipeTileSet()
+COMPILED = TILESET.compiled
+SHAPE = (16, 16)
+
+
+@pytest.fixture
+def solution(make_grid):
+    grid = make_grid(COMPILED, SHAPE, 1)
+    grid.backtracking_collapse(100)
+    return grid.collapsed.copy()
+
+
+# pins every third row and second column of a solution, plus two neighbors that cannot be next to each other
+@pytest.fixture
+def conflicting_tiles(solution, conflicting_pins):
+    tiles = np.full(SHAPE, UNCOLLAPSED, dtype=np.int16)
+    tiles[::3, ::2] = solution[::3, ::2]
+    for pos, tile in conflicting_pins(COMPILED, SHAPE, (7, 7)).items():
+        tiles[pos] = tile
+    return tiles
+
+
+@pytest.mark.parametrize('propagator_factory', [Propagator, SupportPropagator, WavefrontPropagator])
+def test_conflicting_pins_are_minimal(make_grid, conflicting_tiles, propagator_factory):
+    tiles = conflicting_tiles
+    grid = make_grid(COMPILED, SHAPE, propagator_factory=propagator_factory)
+    before = grid.domains.words.copy()
+    with pytest.raises(PinContradiction) as error:
+        grid.pin_array(tiles)
+    assert all(tiles[pos] != UNCOLLAPSED for pos in error.value.pins)
+    assert np.array_equal(grid.domains.words, before)
+
+    # every reported pin is needed: without any one of them the others apply
+    pins = {pos: int(tiles[pos]) for pos in error.value.pins}
+    with pytest.raises(PinContradiction):
+        make_grid(COMPILED, SHAPE, propagator_factory=propagator_factory).pin(pins)
+    for pos in pins:
+        others = {p: t for p, t in pins.items() if p != pos}
+        make_grid(COMPILED, SHAPE, propagator_factory=propagator_factory).pin(others)
+
+
+def test_pins_apply_like_single_collapses(make_grid, solution):
+    tiles = np.full(SHAPE, UNCOLLAPSED, dtype=np.int16)
+    tiles[::4, ::3] = solution[::4, ::3]
+    pinned = make_grid(COMPILED, SHAPE)
+    pinned.pin_array(tiles)
+    assert (pinned.collapsed[tiles >= 0] == tiles[tiles >= 0]).all()
+
+    reference = make_grid(COMPILED, SHAPE)
+    for index in zip(*np.nonzero(tiles >= 0)):
+        pos = tuple(int(i) for i in index)
+        reference.set_domain(pos, reference.pin_domain(int(tiles[pos])))
+        reference.propagator.propagate_from(pos)
+    assert np.array_equal(pinned.domains.words, reference.domains.words)
+
+    pinned.backtracking_collapse(100)
+    assert not COMPILED.conflicts(pinned.collapsed).any()
+    assert (pinned.collapsed[tiles >= 0] == tiles[tiles >= 0]).all()
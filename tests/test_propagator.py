@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from grid.contradiction import PinContradiction
+from propagator import Propagator, SupportPropagator
+from tile_data.directed_pipe_data import DirectedPipeTileSet
+from tiles import bitset
+
+COMPILED = DirectedPipeTileSet().compiled
+SHAPE = (12, 12)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_support_reaches_the_propagator_fixpoint(make_grid, collapse_steps, seed):
+    order = np.random.default_rng(seed).permutation(int(np.prod(SHAPE)))[:30]
+    positions = [tuple(int(i) for i in np.unravel_index(i, SHAPE)) for i in order]
+    expected = collapse_steps(make_grid(COMPILED, SHAPE, seed, propagator_factory=Propagator), positions)
+    actual = collapse_steps(make_grid(COMPILED, SHAPE, seed, propagator_factory=SupportPropagator), positions)
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert np.array_equal(a, e)
+
+
+def test_support_is_reproducible_from_the_seed(make_grid):
+    first, second = [make_grid(COMPILED, SHAPE, 4, propagator_factory=SupportPropagator) for _ in range(2)]
+    first.scanline_collapse()
+    second.scanline_collapse()
+    assert (first.collapsed >= 0).all()
+    assert not COMPILED.conflicts(first.collapsed).any()
+    assert np.array_equal(first.collapsed, second.collapsed)
+
+
+def test_touched_cells_are_written_once(make_grid):
+    grid = make_grid(COMPILED, SHAPE, propagator_factory=SupportPropagator)
+    grid.propagator.propagate_from_all([])
+    written = []
+    set_domain_at = grid.set_domain_at
+
+    def record(i, words):
+        written.append(i)
+        set_domain_at(i, words)
+
+    grid.set_domain_at = record
+    for pos in [(0, 0), (0, 1), (5, 5)]:
+        written.clear()
+        grid.propagated_collapse(pos)
+        assert len(written) == len(set(written))
+
+
+def test_support_counts_survive_a_rollback(make_grid, conflicting_pins):
+    grid = make_grid(COMPILED, SHAPE, 2, propagator_factory=SupportPropagator)
+    for pos in [(0, 0), (0, 1), (1, 0)]:
+        grid.propagated_collapse(pos)
+    before = grid.domains.words.copy()
+
+    with pytest.raises(PinContradiction):
+        grid.pin(conflicting_pins(COMPILED, SHAPE, (6, 6)), explain=False)
+    assert np.array_equal(grid.domains.words, before)
+
+    fresh = SupportPropagator(grid)
+    fresh.initialize()
+    assert np.array_equal(fresh.known, grid.propagator.known)
+    assert np.array_equal(fresh.support, grid.propagator.support)
+
+    grid.scanline_collapse()
+    assert not COMPILED.conflicts(grid.collapsed).any()
+
+
+def test_constrain_resyncs_support_counts(make_grid):
+    grid = make_grid(COMPILED, SHAPE, 3, propagator_factory=SupportPropagator)
+    grid.propagated_collapse((0, 0))
+    tile = int(np.flatnonzero(COMPILED.weights > 0)[0])
+    # a cell and its neighbor written without the propagator, as by a pin
+    neighbor = tuple(p + o for p, o in zip((5, 5), COMPILED.directions[0].value))
+    grid.set_domain((5, 5), grid.pin_domain(tile))
+    grid.set_domain(neighbor, grid.pin_domain(int(np.flatnonzero(COMPILED.compatible[0, tile])[0])))
+    grid.propagator.constrain((5, 5))
+
+    words = grid.domains.words.reshape(-1, grid.domains.words.shape[-1])
+    assert np.array_equal(grid.propagator.known, bitset.to_bool(words, COMPILED.n_tiles))
+    fresh = SupportPropagator(grid)
+    fresh.initialize()
+    assert np.array_equal(fresh.support, grid.propagator.support)
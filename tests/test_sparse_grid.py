@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from grid.entropy import ShannonEntropy
+from propagator import SupportPropagator, WavefrontPropagator
+from tile_data.pipe_data import PipeTileSet
+
+COMPILED = PipeTileSet().compiled
+SHAPE = (24, 24)
+CHUNK_SHAPE = (8, 8)
+
+
+def test_scanline_matches_dense_grid(make_grid):
+    sparse = make_grid(COMPILED, SHAPE, periodic=False, chunk_shape=CHUNK_SHAPE)
+    dense = make_grid(COMPILED, SHAPE, periodic=False)
+    sparse.scanline_collapse()
+    dense.scanline_collapse()
+    assert np.array_equal(sparse.collapsed, dense.collapsed)
+
+
+def test_entropy_queue_follows_allocated_chunks(make_grid):
+    grid = make_grid(COMPILED, SHAPE, 1, periodic=False, chunk_shape=CHUNK_SHAPE)
+    grid.min_entropy_pos()
+    assert len(grid.entropy_queue) == 9
+    grid.min_entropy_collapse()
+    assert (grid.collapsed >= 0).all()
+    assert not COMPILED.conflicts(grid.collapsed).any()
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(propagator_factory=SupportPropagator),
+    dict(propagator_factory=WavefrontPropagator),
+    dict(entropy_factory=ShannonEntropy),
+])
+def test_dense_state_is_refused(make_grid, kwargs):
+    with pytest.raises(ValueError):
+        make_grid(COMPILED, SHAPE, periodic=False, chunk_shape=CHUNK_SHAPE, **kwargs)
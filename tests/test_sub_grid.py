@@ -0,0 +1,31 @@
+import numpy as np
+
+from grid.sub_grid import SubGrid
+from tile_data.pipe_data import PipeTileSet
+from tiles import bitset
+
+COMPILED = PipeTileSet().compiled
+
+
+def test_sub_grid_follows_the_parent_after_fork(make_grid):
+    grid = make_grid(COMPILED, (10, 10), periodic=False)
+    sub_grid = SubGrid(grid, (2, 2), (5, 5), None, None, rng=grid.rng)
+    fork = grid.fork()
+    sub_grid.collapse((3, 3))
+    assert bitset.count(sub_grid.get_domain((3, 3))) == 1
+    assert np.array_equal(sub_grid.get_domain((3, 3)), grid.get_domain((3, 3)))
+    sub_grid.scanline_collapse()
+    assert (grid.collapsed[2:7, 2:7] >= 0).all()
+    assert not grid.compiled.conflicts(grid.collapsed[2:7, 2:7]).any()
+    assert (fork.collapsed == -1).all()
+
+
+def test_wrapping_sub_grid_solves_across_the_edges(make_grid):
+    grid = make_grid(COMPILED, (10, 10), 1)
+    sub_grid = SubGrid(grid, (7, 7), (6, 6), None, None, rng=grid.rng)
+    sub_grid.propagate_boundary()
+    sub_grid.backtracking_collapse()
+    rows = [7, 8, 9, 0, 1, 2]
+    region = grid.collapsed[np.ix_(rows, rows)]
+    assert (region >= 0).all()
+    assert not grid.compiled.conflicts(region).any()
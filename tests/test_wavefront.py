@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from grid.contradiction import PinContradiction
+from propagator import Propagator, WavefrontPropagator
+from tile_data.pipe_data import PipeTileSet
+from tiles import bitset
+
+COMPILED = PipeTileSet().compiled
+SHAPE = (12, 12)
+
+
+@pytest.mark.parametrize('periodic', [True, False])
+@pytest.mark.parametrize('seed', range(3))
+def test_wavefront_reaches_the_propagator_fixpoint(make_grid, collapse_steps, seed, periodic):
+    order = np.random.default_rng(seed).permutation(int(np.prod(SHAPE)))[:30]
+    positions = [tuple(int(i) for i in np.unravel_index(i, SHAPE)) for i in order]
+    expected = collapse_steps(make_grid(COMPILED, SHAPE, seed, periodic, propagator_factory=Propagator), positions)
+    actual = collapse_steps(make_grid(COMPILED, SHAPE, seed, periodic, propagator_factory=WavefrontPropagator),
+                            positions)
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert np.array_equal(a, e)
+
+
+def test_wavefront_is_reproducible_from_the_seed(make_grid):
+    first, second = [make_grid(COMPILED, SHAPE, 7, propagator_factory=WavefrontPropagator) for _ in range(2)]
+    first.scanline_collapse()
+    second.scanline_collapse()
+    assert (first.collapsed >= 0).all()
+    assert not COMPILED.conflicts(first.collapsed).any()
+    assert np.array_equal(first.collapsed, second.collapsed)
+
+
+def test_wavefront_stays_in_sync_after_a_rollback(make_grid, conflicting_pins):
+    grid = make_grid(COMPILED, SHAPE, 1, propagator_factory=WavefrontPropagator)
+    for pos in [(0, 0), (0, 1), (1, 0)]:
+        grid.propagated_collapse(pos)
+    before = grid.domains.words.copy()
+
+    with pytest.raises(PinContradiction):
+        grid.pin(conflicting_pins(COMPILED, SHAPE, (6, 6)), explain=False)
+    assert np.array_equal(grid.domains.words, before)
+    assert np.array_equal(grid.propagator.known, bitset.to_bool(before.reshape(-1, before.shape[-1]),
+                                                                COMPILED.n_tiles))
+
+    grid.scanline_collapse()
+    assert not COMPILED.conflicts(grid.collapsed).any()
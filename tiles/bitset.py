@@ -0,0 +1,51 @@
+from typing import Iterable
+
+import numpy as np
+
+# tile domains are packed little-endian into rows of uint64 words: tile id i lives in bit i % 64 of word i // 64
+WORD_BITS = 64
+WORD_DTYPE = np.dtype('<u8')
+
+
+def n_words(n_tiles: int) -> int:
+    return max(1, (n_tiles + WORD_BITS - 1) // WORD_BITS)
+
+
+def empty(n_tiles: int) -> np.ndarray:
+    return np.zeros(n_words(n_tiles), dtype=WORD_DTYPE)
+
+
+def full(n_tiles: int) -> np.ndarray:
+    return pack(range(n_tiles), n_tiles)
+
+
+def pack(tile_ids: Iterable[int], n_tiles: int) -> np.ndarray:
+    bits = np.zeros(n_words(n_tiles) * WORD_BITS, dtype=bool)
+    bits[list(tile_ids)] = True
+    return from_bool(bits)
+
+
+def unpack(words: np.ndarray) -> np.ndarray:
+    return np.unpackbits(_as_bytes(words), bitorder='little').nonzero()[0]
+
+
+def count(words: np.ndarray) -> int:
+    return int(np.unpackbits(_as_bytes(words)).sum())
+
+
+def to_bool(words: np.ndarray, n_tiles: int) -> np.ndarray:
+    return np.unpackbits(_as_bytes(words), axis=-1, bitorder='little')[..., :n_tiles].astype(bool)
+
+
+def from_bool(bits: np.ndarray) -> np.ndarray:
+    n_tiles = bits.shape[-1]
+    padding = n_words(n_tiles) * WORD_BITS - n_tiles
+    if padding:
+        bits = np.concatenate([bits, np.zeros(bits.shape[:-1] + (padding,), dtype=bool)], axis=-1)
+    return np.packbits(bits, axis=-1, bitorder='little').view(WORD_DTYPE)
+
+
+def _as_bytes(words: np.ndarray) -> np.ndarray:
+    if words.dtype != WORD_DTYPE or not words.flags.c_contiguous:
+        words = np.ascontiguousarray(words, dtype=WORD_DTYPE)
+    return words.view(np.uint8)
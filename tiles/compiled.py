@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from directions import Directions, DIRECTIONS_DIM_MAP
+from tiles import bitset
+from tiles.data import TileData
+from tiles.graphics import TilePixels, MatrixActionGraphics
+from tiles.names import TileNames
+
+
+# array form of a tileset, indexed by tile id and direction index
+# compatible[k, a, b] is True iff tile b may sit in direction k of tile a
+# atlas holds the (n_tiles, h, w) pixels of TilePixels tilesets, transforms the (n_tiles, d, d) matrices of
+# MatrixActionGraphics tilesets
+@dataclass
+class CompiledTileSet:
+    tile_values: np.ndarray
+    weights: np.ndarray
+    directions: List[Directions]
+    reverse: np.ndarray
+    compatible: np.ndarray
+    compatible_words: np.ndarray
+    atlas: Optional[np.ndarray] = None
+    transforms: Optional[np.ndarray] = None
+    direction_index: Dict[Directions, int] = field(init=False)
+
+    def __post_init__(self):
+        self.direction_index = {d: k for k, d in enumerate(self.directions)}
+
+    @classmethod
+    def from_tile_data(cls, tile_data: Dict[TileNames, TileData]) -> CompiledTileSet:
+        tiles = sorted(tile_data.values(), key=lambda data: data.tile_id)
+        dim = len(next(iter(tiles[0].compatible_tiles)).value)
+        directions = list(DIRECTIONS_DIM_MAP[dim])
+        compatible = np.zeros((len(directions), len(tiles), len(tiles)), dtype=bool)
+        for k, direction in enumerate(directions):
+            for data in tiles:
+                compatible[k, data.tile_id, [tile_data[t].tile_id for t in data.compatible_tiles[direction]]] = True
+        graphics = [data.graphics for data in tiles]
+        return cls(
+            tile_values=np.array([str(data.name.value) for data in tiles]),
+            weights=np.array([data.weight for data in tiles], dtype=float),
+            directions=directions,
+            reverse=np.array([directions.index(d.reverse()) for d in directions]),
+            compatible=compatible,
+            compatible_words=bitset.from_bool(compatible),
+            atlas=np.array([g.array for g in graphics], dtype=float)
+            if all(isinstance(g, TilePixels) for g in graphics) else None,
+            transforms=np.array([g.action.matrix for g in graphics])
+            if all(isinstance(g, MatrixActionGraphics) for g in graphics) else None
+        )
+
+    @property
+    def n_tiles(self) -> int:
+        return len(self.tile_values)
+
+    @property
+    def n_words(self) -> int:
+        return bitset.n_words(self.n_tiles)
+
+    def compatible_domain(self, words: np.ndarray, k: int) -> np.ndarray:
+        return np.bitwise_or.reduce(self.compatible_words[k][bitset.unpack(words)], axis=0)
+
+    def allowed_neighbors(self, domains: np.ndarray, k: int) -> np.ndarray:
+        # (..., n_tiles) boolean domains -> tiles allowed in direction k of each of them
+        return (domains.astype(np.float32) @ self.compatible[k].astype(np.float32)) > 0
+
+    def conflicts(self, tile_ids: np.ndarray) -> np.ndarray:
+        # marks cells of a fully collapsed, non-periodic tile id array that disagree with an in-array neighbor
+        out = np.zeros(tile_ids.shape, dtype=bool)
+        for k, direction in enumerate(self.directions):
+            src = tuple(slice(max(0, -o), n - max(0, o)) for o, n in zip(direction.value, tile_ids.shape))
+            dst = tuple(slice(max(0, o), n - max(0, -o)) for o, n in zip(direction.value, tile_ids.shape))
+            bad = ~self.compatible[k, tile_ids[src], tile_ids[dst]]
+            out[src] |= bad
+            out[dst] |= bad
+        return out
+
+    def render(self, tile_ids: np.ndarray, words: Optional[np.ndarray] = None) -> np.ndarray:
+        # image of a 2d grid from its (rows, cols) tile ids, see render_cells
+        pixels = self.render_cells(tile_ids, words)
+        rows, cols = tile_ids.shape
+        return pixels.swapaxes(1, 2).reshape((rows * pixels.shape[2], cols * pixels.shape[3]) + pixels.shape[4:])
+
+    def render_cells(self, tile_ids: np.ndarray, words: Optional[np.ndarray] = None) -> np.ndarray:
+        # (*shape, h, w) pixels of cells with tile ids of any shape and, for the cells that are not collapsed
+        # (tile id < 0), their (*shape, n_words) domains, which show the mean of the tiles they still allow
+        # rendered in float32 like the tile pixels themselves, which halves the size of large frames
+        if self.atlas is None:
+            raise ValueError("Tileset has no pixel atlas")
+        atlas = self.atlas.astype(np.float32, copy=False)
+        pixels = atlas[np.maximum(tile_ids, 0)]
+        open_cells = tile_ids < 0
+        if open_cells.any():
+            if words is None:
+                raise ValueError("Domains are needed to render cells that are not collapsed")
+            domains = bitset.to_bool(words[open_cells], self.n_tiles).astype(np.float32)
+            domains /= np.maximum(domains.sum(axis=-1, keepdims=True), 1)
+            pixels[open_cells] = (domains @ atlas.reshape(self.n_tiles, -1)).reshape((-1,) + atlas.shape[1:])
+        return pixels
+
+    def fingerprint(self) -> str:
+        # identifies the constraints and weights, which is all that propagation depends on
+        digest = hashlib.sha1()
+        digest.update(np.array([d.value for d in self.directions]).tobytes())
+        digest.update(np.ascontiguousarray(self.compatible).tobytes())
+        digest.update(np.ascontiguousarray(self.weights, dtype=float).tobytes())
+        return digest.hexdigest()
@@ -74,11 +74,11 @@ class SymmetryGeneratedProtoTileData(ProtoTileData, GroupTargetMixin):
         )
 
 
-def random_tile(tile_data, tiles):
-    tile_list = list(tiles)
+def random_tile(tile_data, tiles, rng=np.random):
+    tile_list = sorted(tiles, key=lambda t: tile_data[t].tile_id)
     probs = np.array([tile_data[t].weight for t in tile_list])
     probs = probs / sum(probs)
-    return np.random.choice(tile_list, p=probs)
+    return tile_list[rng.choice(len(tile_list), p=probs)]
 
 
 @dataclass
@@ -87,3 +87,4 @@ class TileData:
     weight: float
     compatible_tiles: Dict[Directions, Set[TileNames]]
     graphics: TileGraphics
+    tile_id: int
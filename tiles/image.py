@@ -0,0 +1,99 @@
+import os
+import struct
+import zlib
+from typing import Iterator, Optional, Callable, Tuple
+
+import numpy as np
+
+from tiles.compiled import CompiledTileSet
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# PNG color type by the number of channels of a pixel
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+# reads the cells of rows lo:hi of a 2d map as their tile ids and domains (see CompiledTileSet.render), e.g. through
+# the block accessor of a domain store; the domains are only used for bands with uncollapsed cells
+BandReader = Callable[[int, int], Tuple[np.ndarray, Optional[np.ndarray]]]
+
+
+# band reader of a map given as arrays, which may be memmaps and are only read band by band as well
+def array_reader(tile_ids: np.ndarray, words: Optional[np.ndarray] = None) -> BandReader:
+    return lambda lo, hi: (np.asarray(tile_ids[lo:hi]), None if words is None else words[lo:hi])
+
+
+# images of 2d maps of the given shape in cells rendered from the pixel atlas in bands of band_rows rows of cells,
+# so that writing a map never holds more than one band of cells and pixels
+def render_bands(compiled: CompiledTileSet, shape: Tuple[int, int], read_band: BandReader,
+                 band_rows: int = 8) -> Iterator[np.ndarray]:
+    for lo in range(0, shape[0], band_rows):
+        tile_ids, words = read_band(lo, min(lo + band_rows, shape[0]))
+        yield compiled.render(tile_ids, None if words is None or (tile_ids >= 0).all() else words)
+
+
+def image_shape(compiled: CompiledTileSet, shape: Tuple[int, int]):
+    (rows, cols), (h, w) = shape, compiled.atlas.shape[1:3]
+    return (rows * h, cols * w) + compiled.atlas.shape[3:]
+
+
+# pixels in [0, 1] as 8 bit values
+def to_uint8(pixels: np.ndarray) -> np.ndarray:
+    return np.rint(np.clip(pixels, 0, 1) * 255).astype(np.uint8)
+
+
+# writes a .png or a .npy file depending on the extension of path
+def write_image(path: str, compiled: CompiledTileSet, shape: Tuple[int, int], read_band: BandReader,
+                band_rows: int = 8):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.png':
+        write_png(path, compiled, shape, read_band, band_rows)
+    elif extension == '.npy':
+        write_npy(path, compiled, shape, read_band, band_rows)
+    else:
+        raise ValueError(f"Unknown image format {extension}")
+
+
+# 8 bit PNG whose image data is compressed scanline by scanline as the bands come in, one IDAT chunk per piece of
+# compressed output
+def write_png(path: str, compiled: CompiledTileSet, shape: Tuple[int, int], read_band: BandReader,
+              band_rows: int = 8, level: int = 6):
+    pixel_shape = image_shape(compiled, shape)
+    channels = pixel_shape[2] if len(pixel_shape) == 3 else 1
+    if channels not in PNG_COLOR_TYPES:
+        raise ValueError(f"Cannot write pixels with {channels} channels to a PNG")
+    compressor = zlib.compressobj(level)
+    with open(path, 'wb') as file:
+        file.write(PNG_SIGNATURE)
+        _write_chunk(file, b'IHDR', struct.pack(
+            '>IIBBBBB', pixel_shape[1], pixel_shape[0], 8, PNG_COLOR_TYPES[channels], 0, 0, 0
+        ))
+        for band in render_bands(compiled, shape, read_band, band_rows):
+            # every scanline starts with its filter type, 0 for none
+            scanlines = to_uint8(band).reshape(band.shape[0], -1)
+            data = compressor.compress(np.concatenate(
+                [np.zeros((len(scanlines), 1), dtype=np.uint8), scanlines], axis=1
+            ).tobytes())
+            if data:
+                _write_chunk(file, b'IDAT', data)
+        _write_chunk(file, b'IDAT', compressor.flush())
+        _write_chunk(file, b'IEND', b'')
+
+
+def _write_chunk(file, chunk_type: bytes, data: bytes):
+    file.write(struct.pack('>I', len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+# .npy file of 8 bit pixels, or of float32 pixels as they are rendered, written through a memmap that is flushed
+# after every band
+def write_npy(path: str, compiled: CompiledTileSet, shape: Tuple[int, int], read_band: BandReader,
+              band_rows: int = 8, dtype=np.uint8):
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=image_shape(compiled, shape))
+    lo = 0
+    for band in render_bands(compiled, shape, read_band, band_rows):
+        out[lo:lo + band.shape[0]] = to_uint8(band) if out.dtype == np.uint8 else band
+        out.flush()
+        lo += band.shape[0]
+    del out
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, Tuple
+
+import numpy as np
+
+from directions import Directions
+from tiles.compiled import CompiledTileSet
+
+_ALIGNMENT = 64
+_ARRAY_FIELDS = ('tile_values', 'weights', 'reverse', 'compatible', 'compatible_words', 'atlas', 'transforms')
+
+
+# picklable description of a compiled tileset published in one shared memory block
+@dataclass(frozen=True)
+class SharedTileSetHandle:
+    block_name: str
+    layout: Dict[str, Tuple[int, Tuple[int, ...], str]]
+
+
+class SharedTileSet:
+    def __init__(self, compiled: CompiledTileSet, memory: shared_memory.SharedMemory, handle: SharedTileSetHandle):
+        self.compiled = compiled
+        self.memory = memory
+        self.handle = handle
+
+    @classmethod
+    def publish(cls, compiled: CompiledTileSet) -> SharedTileSet:
+        arrays = {name: getattr(compiled, name) for name in _ARRAY_FIELDS if getattr(compiled, name) is not None}
+        arrays['direction_offsets'] = np.array([d.value for d in compiled.directions])
+        layout, size = {}, 0
+        for name, array in arrays.items():
+            layout[name] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        handle = SharedTileSetHandle(memory.name, layout)
+        for name, array in arrays.items():
+            _view(memory, handle.layout[name])[...] = array
+        return cls(_from_views(memory, handle), memory, handle)
+
+    @classmethod
+    def attach(cls, handle: SharedTileSetHandle) -> SharedTileSet:
+        memory = attach_untracked(handle.block_name)
+        return cls(_from_views(memory, handle), memory, handle)
+
+    def close(self):
+        self.compiled = None
+        self.memory.close()
+
+    def unlink(self):
+        self.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+
+# the publishing process owns the block, so attaching must not register it with the resource tracker
+# (which would unlink it when an attached worker exits); python < 3.13 has no track=False
+def attach_untracked(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _view(memory: shared_memory.SharedMemory, spec: Tuple[int, Tuple[int, ...], str]) -> np.ndarray:
+    offset, shape, dtype = spec
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+
+
+def _from_views(memory: shared_memory.SharedMemory, handle: SharedTileSetHandle) -> CompiledTileSet:
+    arrays = {name: _view(memory, spec) for name, spec in handle.layout.items()}
+    for array in arrays.values():
+        array.flags.writeable = False
+    return CompiledTileSet(
+        directions=[Directions(tuple(int(x) for x in offset)) for offset in arrays.pop('direction_offsets')],
+        **arrays
+    )
@@ -8,6 +8,7 @@ from symmetry.cubic_groups import CUBIC_GROUP, CubicGroupAction
 from symmetry.groups import Group, GroupAction
 from symmetry.planar_groups import D4_SQUARE
 from symmetry.tile_symmetry_generator import TileSymmetryGenerator
+from tiles.compiled import CompiledTileSet
 from tiles.data import TileConstraints, ProtoTileData, TileData
 from tiles.graphics import TileGraphics, MatrixActionGraphics
 from tiles.names import ProtoTileNames, TileNames
@@ -22,7 +23,10 @@ class TileSet(ABC):
         self.proto_tile_data = self.build_proto_data()
         self.sym_proto_tile_data = self.symmetry_build()
         self.tile_data = self.generate_compatible_tiles()
+        self.compiled = self.compile()
         self.tile_name_enum: Type[ProtoTileNames]
+        # immutable, so that every cell starting out with any tile can share it
+        self.any_tile = frozenset(self.tile_name_enum)
 
     @property
     @abstractmethod
@@ -74,10 +78,14 @@ class TileSet(ABC):
                     direction: self.get_connector_compatible_tiles(connector, direction)
                     for direction, connector in self.sym_proto_tile_data[tile].constraints.get_map().items()
                 },
-                graphics=self.sym_proto_tile_data[tile].graphics
-            ) for tile in self.tile_name_enum
+                graphics=self.sym_proto_tile_data[tile].graphics,
+                tile_id=tile_id
+            ) for tile_id, tile in enumerate(self.tile_name_enum)
         }
 
+    def compile(self) -> CompiledTileSet:
+        return CompiledTileSet.from_tile_data(self.tile_data)
+
     def get_connector_compatible_tiles(self, connector: Connectors, direction: Directions):
         return {
             tile for tile in self.tile_name_enum
@@ -106,7 +114,8 @@ class TileSet(ABC):
         new_tile_names = set()
         for name in self.sym_gens.keys():
             new_tile_names = new_tile_names.union(self.sym_gens[name].generate_tile_names(name))
-        self.tile_name_enum = Enum(self.SYM_PROTO_TILE_NAMES_ENUM_NAME, {name: name for name in new_tile_names})
+        # sorted so that tile ids (enum order) do not depend on set iteration order
+        self.tile_name_enum = Enum(self.SYM_PROTO_TILE_NAMES_ENUM_NAME, {name: name for name in sorted(new_tile_names)})
         output_tiles = {}
         for name, tile_data in self.proto_tile_data.items():
             output_tiles.update(self.sym_gens[name].generate(self.tile_name_enum, tile_data))